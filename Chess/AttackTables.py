@@ -0,0 +1,152 @@
+"""
+Precomputed attack tables, built once at import time
+Squares are numbered from a8 (0) to h1 (63), so square = row * 8 + column matches board[row][column].
+A bitboard is an int with bit n set for square n.
+"""
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL_BOARD ^ FILE_A
+NOT_FILE_H = FULL_BOARD ^ FILE_H
+NOT_FILES_AB = NOT_FILE_A & (NOT_FILE_A << 1)
+NOT_FILES_GH = NOT_FILE_H & (NOT_FILE_H >> 1)
+RANK_3 = 0xFF << 40
+RANK_6 = 0xFF << 16
+
+# Orthogonal directions first, then diagonals. Opposite directions are paired, so the
+# opposite of direction index d is d ^ 1
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (1, -1), (-1, 1))
+DIRECTION_INDEX = {direction: index for index, direction in enumerate(DIRECTIONS)}
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+# Directions walking towards higher square numbers, where the nearest blocker is the lowest bit
+POSITIVE_DIRECTIONS = (False, True, False, True, False, True, True, False)
+
+# (row, column) of every square
+SQUARES = tuple((square >> 3, square & 7) for square in range(64))
+
+
+def knight_attacks(bitboard):
+    """
+    Squares attacked by every knight of a bitboard
+    :param bitboard: int
+    :return: int
+    """
+    one = ((bitboard >> 1) & NOT_FILE_H) | ((bitboard << 1) & NOT_FILE_A)
+    two = ((bitboard >> 2) & NOT_FILES_GH) | ((bitboard << 2) & NOT_FILES_AB)
+    return ((one << 16) | (one >> 16) | (two << 8) | (two >> 8)) & FULL_BOARD
+
+
+def king_attacks(bitboard):
+    """
+    Squares attacked by every king of a bitboard
+    :param bitboard: int
+    :return: int
+    """
+    row = bitboard | ((bitboard >> 1) & NOT_FILE_H) | ((bitboard << 1) & NOT_FILE_A)
+    return ((row | (row << 8) | (row >> 8)) & FULL_BOARD) ^ bitboard
+
+
+def pawn_attacks(bitboard, white):
+    """
+    Squares attacked by every pawn of a bitboard
+    :param bitboard: int
+    :param white: boolean, color of the pawns
+    :return: int
+    """
+    if white:
+        return ((bitboard >> 9) & NOT_FILE_H) | ((bitboard >> 7) & NOT_FILE_A)
+    return (((bitboard << 7) & NOT_FILE_H) | ((bitboard << 9) & NOT_FILE_A)) & FULL_BOARD
+
+
+def build_ray(square, direction):
+    """
+    Squares from square (excluded) to the edge of the board
+    :param square: int
+    :param direction: tuple (row step, column step)
+    :return: int
+    """
+    row, column = SQUARES[square]
+    ray = 0
+    row += direction[0]
+    column += direction[1]
+    while 0 <= row <= 7 and 0 <= column <= 7:
+        ray |= 1 << (row * 8 + column)
+        row += direction[0]
+        column += direction[1]
+    return ray
+
+
+KNIGHT_ATTACKS = tuple(knight_attacks(1 << square) for square in range(64))
+KING_ATTACKS = tuple(king_attacks(1 << square) for square in range(64))
+# PAWN_ATTACKS[color][square], white = 0 and black = 1
+PAWN_ATTACKS = (
+    tuple(pawn_attacks(1 << square, True) for square in range(64)),
+    tuple(pawn_attacks(1 << square, False) for square in range(64)),
+)
+# RAYS[direction index][square]
+RAYS = tuple(tuple(build_ray(square, direction) for square in range(64)) for direction in DIRECTIONS)
+
+# Every square a rook or a bishop reaches from a square on an empty board
+ROOK_RAYS = tuple(RAYS[0][square] | RAYS[1][square] | RAYS[2][square] | RAYS[3][square] for square in range(64))
+BISHOP_RAYS = tuple(RAYS[4][square] | RAYS[5][square] | RAYS[6][square] | RAYS[7][square] for square in range(64))
+
+
+def build_between(start, end):
+    """
+    Squares strictly between two squares on the same line
+    :param start: int
+    :param end: int
+    :return: int, 0 if the squares do not share a rank, file or diagonal or are neighbours
+    """
+    for rays in RAYS:
+        if rays[start] >> end & 1:
+            return rays[start] & ~rays[end] & ~(1 << end)
+    return 0
+
+
+# BETWEEN[start][end], the squares a piece can block a check on
+BETWEEN = tuple(tuple(build_between(start, end) for end in range(64)) for start in range(64))
+
+
+def rook_attacks(square, occupied):
+    """
+    Squares a rook on square attacks
+    :param square: int
+    :param occupied: bitboard of every piece
+    :return: int
+    """
+    attacks = 0
+    for direction in ROOK_DIRECTIONS:
+        rays = RAYS[direction]
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE_DIRECTIONS[direction]:
+                ray ^= rays[(blockers & -blockers).bit_length() - 1]
+            else:
+                ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(square, occupied):
+    """
+    Squares a bishop on square attacks
+    :param square: int
+    :param occupied: bitboard of every piece
+    :return: int
+    """
+    attacks = 0
+    for direction in BISHOP_DIRECTIONS:
+        rays = RAYS[direction]
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE_DIRECTIONS[direction]:
+                ray ^= rays[(blockers & -blockers).bit_length() - 1]
+            else:
+                ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
@@ -1,110 +1,542 @@
+from array import array
+
+from Chess.AttackTables import (
+    BETWEEN, BISHOP_RAYS, DIRECTION_INDEX, DIRECTIONS, FULL_BOARD, KING_ATTACKS, KNIGHT_ATTACKS, NOT_FILE_A,
+    NOT_FILE_H, PAWN_ATTACKS, POSITIVE_DIRECTIONS, RANK_3, RANK_6, RAYS, ROOK_RAYS, SQUARES, bishop_attacks, knight_attacks,
+    pawn_attacks, rook_attacks,
+)
+from Chess.Evaluation import SQUARE_SCORES, evaluate_squares
+from Chess.Zobrist import BLACK_TO_MOVE_KEY, PIECE_KEYS, compute_hash, compute_pawn_hash
+
+# Piece codes are color << 3 | type
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+
+PIECE_CODES = {
+    "--": 0,
+    "wP": 1, "wN": 2, "wB": 3, "wR": 4, "wQ": 5, "wK": 6,
+    "bP": 9, "bN": 10, "bB": 11, "bR": 12, "bQ": 13, "bK": 14,
+}
+PIECE_NAMES = ["--"] * 16
+for _name, _code in PIECE_CODES.items():
+    PIECE_NAMES[_code] = _name
+
+# Moves are packed in an int:
+# bits 0-5 start square, 6-11 end square, 12-15 piece moved, 16-19 piece captured,
+# 20-23 promotion piece and 24-27 flags, both reserved for the rules still missing
+MOVE_END_SHIFT = 6
+MOVE_PIECE_SHIFT = 12
+MOVE_CAPTURED_SHIFT = 16
+MOVE_PROMOTION_SHIFT = 20
+MOVE_FLAGS_SHIFT = 24
+
+# Kinds of moves asked from get_valid_move_codes, combined with |
+# EVASIONS means every valid move when in check and none otherwise
+CAPTURES = 1
+QUIETS = 2
+ALL_MOVES = CAPTURES | QUIETS
+EVASIONS = 4
+
+
 class GameState:
     """
     Class responsable for keeping up informations about the actual gameState
     Determine the valid moves
     Keep info about old moves
+    The position is held in squares only: board is rebuilt from it on every read, and assigning
+    to board[row][column] no longer changes the position, use make_move or from_fen
     """
-    def __init__(self):
-        """
-        board: bidimensional list of strings which represent the board
-        """
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"],
-        ]
-
-        self.move_functions = {
-            'P': self.get_pawn_moves,
-            'R': self.get_rook_moves,
-            'N': self.get_knight_moves,
-            'K': self.get_king_moves,
-            'Q': self.get_queen_moves,
-            'B': self.get_bishop_moves,
-        }
-
-        self.move_log = []
-        self.white_turn = True
-
-        self.white_king = (7, 4)
-        self.black_king = (0, 4)
+    # No __dict__, a game kept by the server costs a few kilobytes, see compact
+    __slots__ = (
+        "squares", "white_turn", "first_move_number", "move_buffers", "buffer_base", "in_check", "pins", "checks",
+        "target_mask", "king_target_mask", "instrumentation", "bitboards", "occupancy", "occupied", "white_king",
+        "black_king", "slider_attacks", "attack_log", "attack_maps", "move_log", "zobrist_key", "pawn_key",
+        "evaluation",
+    )
+
+    def __init__(self, board=None, white_turn=True):
+        """
+        :param board: bidimensional list of strings, the starting position if omitted
+        :param white_turn: boolean
+        squares: piece code on each square, a8 first, see board for the strings
+        bitboards: one bitboard per piece code
+        occupancy: one bitboard per color, occupied is their union
+        slider_attacks: squares attacked by the rook, bishop or queen standing on each square
+        attack_maps: every square attacked by each color, see get_attack_map
+        zobrist_key: Zobrist key of the position, see hash
+        pawn_key: Zobrist key of the pawns only
+        move_log: packed moves played, see MOVE_END_SHIFT
+        evaluation: material and piece-square score from white's point of view, see Evaluation
+        """
+        if board is None:
+            board = [
+                ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+                ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
+                ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"],
+            ]
+        self.squares = bytearray([PIECE_CODES[piece] for row in board for piece in row])
+
+        # One reusable move buffer per ply from buffer_base, see get_valid_move_codes
+        self.move_buffers = []
+        self.buffer_base = 0
+        self.white_turn = white_turn
+        # Move number of the position the game started from, see to_fen
+        self.first_move_number = 1
 
         self.in_check = False
         self.pins = []
         self.checks = []
+        # Destination squares allowed to the generators, the king has its own, see get_valid_move_codes
+        self.target_mask = FULL_BOARD
+        self.king_target_mask = FULL_BOARD
+        # Counters of enable_stats, None while disabled
+        self.instrumentation = None
+        self.init_position()
+
+    def init_position(self):
+        """
+        Compute every derived structure from squares and white_turn: bitboards, kings location,
+        slider attacks and hash. The move history is cleared
+        :return: void
+        """
+        self.bitboards = [0] * 16
+        self.occupancy = [0, 0]
+        for square, piece in enumerate(self.squares):
+            if piece:
+                self.bitboards[piece] |= 1 << square
+                self.occupancy[piece >> 3] |= 1 << square
+        self.occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+        # Kings default to their starting squares when missing from board
+        white_king = self.bitboards[KING]
+        black_king = self.bitboards[BLACK << 3 | KING]
+        self.white_king = SQUARES[white_king.bit_length() - 1] if white_king else (7, 4)
+        self.black_king = SQUARES[black_king.bit_length() - 1] if black_king else (0, 4)
+
+        self.slider_attacks = [0] * 64
+        self.attack_log = []
+        self.init_attacks()
+
+        self.move_log = array('I')
+        self.move_buffers = []
+        self.buffer_base = 0
+        self.zobrist_key = compute_hash(self.squares, self.white_turn)
+        self.pawn_key = compute_pawn_hash(self.squares)
+        self.evaluation = evaluate_squares(self.squares)
+
+    @property
+    def board(self):
+        """
+        The position as a bidimensional list of strings such as "wP", "--" for an empty square
+        Built from squares on every access, which costs 64 lookups: read squares in loops. Changing
+        the lists returned does not change the position
+        :return: list of 8 lists of 8 str
+        """
+        return [[PIECE_NAMES[piece] for piece in self.squares[row:row + 8]] for row in range(0, 64, 8)]
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Build a GameState from a FEN string. Castling rights, en passant square and halfmove clock
+        are ignored, GameState does not implement those rules yet
+        ValueError is raised for unknown pieces, ranks of the wrong length, a side without exactly one king
+        or a side not to move in check
+        :param fen: str
+        :return: GameState
+        """
+        fields = fen.split()
+        if not fields:
+            raise ValueError("Empty FEN")
+        board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char in "12345678":
+                    row.extend(["--"] * int(char))
+                elif char in "PNBRQKpnbrqk":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError("Invalid FEN piece: {}".format(char))
+            if len(row) != 8:
+                raise ValueError("Invalid FEN rank: {}".format(rank))
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError("Invalid FEN placement: {}".format(fields[0]))
+        for king in ("wK", "bK"):
+            kings = sum(row.count(king) for row in board)
+            if kings != 1:
+                raise ValueError("Invalid FEN: {} {} kings instead of one".format(kings, king))
+        if len(fields) >= 2 and fields[1] not in ("w", "b"):
+            raise ValueError("Invalid FEN side to move: {}".format(fields[1]))
+
+        game_state = cls(board, len(fields) < 2 or fields[1] == "w")
+        # The side to move could capture the other king
+        row, column = game_state.black_king if game_state.white_turn else game_state.white_king
+        if game_state.is_attacked(row * 8 + column, WHITE if game_state.white_turn else BLACK):
+            raise ValueError("Invalid FEN: the side not to move is in check")
+        if len(fields) >= 6:
+            game_state.first_move_number = int(fields[5])
+        return game_state
+
+    def to_fen(self):
+        """
+        FEN string of the position, with no castling rights, no en passant square and a zero halfmove clock
+        :return: str
+        """
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + str(empty) if empty else rank)
+        white_started = self.white_turn == (len(self.move_log) % 2 == 0)
+        move_number = self.first_move_number + (len(self.move_log) + (0 if white_started else 1)) // 2
+        return "{} {} - - 0 {}".format("/".join(ranks), "w" if self.white_turn else "b", move_number)
+
+    def snapshot(self):
+        """
+        Immutable copy of the position: the 64 piece codes followed by the side to move, 65 bytes
+        The move history is not part of it
+        :return: bytes
+        """
+        return bytes(self.squares) + (b"\x00" if self.white_turn else b"\x01")
+
+    def restore(self, snapshot):
+        """
+        Set the position from snapshot, clearing the move history
+        :param snapshot: bytes, see snapshot
+        :return: void
+        """
+        self.squares = bytearray(snapshot[:64])
+        self.white_turn = not snapshot[64]
+        self.first_move_number = 1
+        self.init_position()
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        :param snapshot: bytes, see snapshot
+        :return: GameState
+        """
+        return cls([[PIECE_NAMES[piece] for piece in snapshot[row:row + 8]] for row in range(0, 64, 8)],
+                   not snapshot[64])
 
     def make_move(self, move):
-        self.board[move.start_row][move.start_column] = "--"
-        self.board[move.end_row][move.end_column] = move.piece_moved
+        """
+        :param move: Move, or the int it packs
+        :return: void
+        """
+        start = move & 63
+        end = (move >> MOVE_END_SHIFT) & 63
+        piece_moved = (move >> MOVE_PIECE_SHIFT) & 15
+
+        self.squares[start] = 0
+        self.squares[end] = piece_moved
+        self.update_bitboards(move)
+        self.update_attacks(start, end)
+        self.update_hash(move)
+        scores = SQUARE_SCORES[piece_moved]
+        self.evaluation += scores[end] - scores[start] - SQUARE_SCORES[(move >> MOVE_CAPTURED_SHIFT) & 15][end]
         self.move_log.append(move)
         self.white_turn = not self.white_turn
 
         # Update kings location
-        if move.piece_moved == "wK":
-            self.white_king = (move.end_row, move.end_column)
-        elif move.piece_moved == "bK":
-            self.black_king = (move.end_row, move.end_column)
+        if piece_moved == KING:
+            self.white_king = SQUARES[end]
+        elif piece_moved == BLACK << 3 | KING:
+            self.black_king = SQUARES[end]
 
     def rollback_move(self):
         if len(self.move_log) != 0:
             last_move = self.move_log.pop()
-            self.board[last_move.end_row][last_move.end_column] = last_move.piece_captured
-            self.board[last_move.start_row][last_move.start_column] = last_move.piece_moved
+            start = last_move & 63
+            end = (last_move >> MOVE_END_SHIFT) & 63
+            piece_moved = (last_move >> MOVE_PIECE_SHIFT) & 15
+            piece_captured = (last_move >> MOVE_CAPTURED_SHIFT) & 15
+
+            self.squares[end] = piece_captured
+            self.squares[start] = piece_moved
+            self.update_bitboards(last_move)
+            if self.attack_log:
+                self.rollback_attacks()
+            else:
+                # The move was made before compact dropped its log
+                self.slider_attacks = [0] * 64
+                self.init_attacks()
+            self.update_hash(last_move)
+            scores = SQUARE_SCORES[piece_moved]
+            self.evaluation -= scores[end] - scores[start] - SQUARE_SCORES[piece_captured][end]
             self.white_turn = not self.white_turn
 
             # Updates kings position
-            if last_move.piece_moved == "wK":
-                self.white_king = (last_move.start_row, last_move.start_column)
-            elif last_move.piece_moved == "bK":
-                self.black_king = (last_move.start_row, last_move.start_column)
+            if piece_moved == KING:
+                self.white_king = SQUARES[start]
+            elif piece_moved == BLACK << 3 | KING:
+                self.black_king = SQUARES[start]
+
+    def compact(self):
+        """
+        Drop what only speeds up searching and rolling back, for a game kept idle between moves:
+        the move buffers and the attack log. Moves made before can still be rolled back, their
+        slider attacks are then computed from scratch
+        :return: void
+        """
+        self.move_buffers = []
+        self.buffer_base = len(self.move_log)
+        self.attack_log = []
+
+    def update_bitboards(self, move):
+        """
+        Toggle move in the bitboards, the same call makes and rolls back a move
+        :param move: Move, or the int it packs
+        :return: void
+        """
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        start_bit = 1 << (move & 63)
+        end_bit = 1 << ((move >> MOVE_END_SHIFT) & 63)
+        piece_moved = (move >> MOVE_PIECE_SHIFT) & 15
+        piece_captured = (move >> MOVE_CAPTURED_SHIFT) & 15
+
+        bitboards[piece_moved] ^= start_bit | end_bit
+        occupancy[piece_moved >> 3] ^= start_bit | end_bit
+        if piece_captured:
+            bitboards[piece_captured] ^= end_bit
+            occupancy[piece_captured >> 3] ^= end_bit
+        self.occupied = occupancy[WHITE] | occupancy[BLACK]
+
+    @property
+    def hash(self):
+        """
+        64 bit Zobrist key of the position: pieces and side to move
+        Equal positions have equal keys whatever the moves that led to them
+        :return: int
+        """
+        return self.zobrist_key
+
+    def update_hash(self, move):
+        """
+        Toggle move in zobrist_key and pawn_key, the same call makes and rolls back a move
+        :param move: Move, or the int it packs
+        :return: void
+        """
+        piece_moved = (move >> MOVE_PIECE_SHIFT) & 15
+        piece_keys = PIECE_KEYS[piece_moved]
+        moved = piece_keys[move & 63] ^ piece_keys[(move >> MOVE_END_SHIFT) & 63]
+        key = self.zobrist_key ^ moved ^ BLACK_TO_MOVE_KEY
+        if piece_moved & 7 == PAWN:
+            self.pawn_key ^= moved
+        piece_captured = (move >> MOVE_CAPTURED_SHIFT) & 15
+        if piece_captured:
+            captured = PIECE_KEYS[piece_captured][(move >> MOVE_END_SHIFT) & 63]
+            key ^= captured
+            if piece_captured & 7 == PAWN:
+                self.pawn_key ^= captured
+        self.zobrist_key = key
+
+    def init_attacks(self):
+        """
+        Compute slider_attacks from scratch
+        :return: void
+        """
+        occupied = self.occupied
+        orthogonal, diagonal = self.get_sliders()
+        sliders = orthogonal | diagonal
+        while sliders:
+            bit = sliders & -sliders
+            square = bit.bit_length() - 1
+            self.slider_attacks[square] = (rook_attacks(square, occupied) if bit & orthogonal else 0) | \
+                                          (bishop_attacks(square, occupied) if bit & diagonal else 0)
+            sliders ^= bit
+        self.attack_maps = [None, None]
+
+    def get_sliders(self):
+        """
+        Rooks and queens, then bishops and queens, of both colors
+        :return: tuple of bitboards
+        """
+        bitboards = self.bitboards
+        queens = bitboards[QUEEN] | bitboards[BLACK << 3 | QUEEN]
+        return bitboards[ROOK] | bitboards[BLACK << 3 | ROOK] | queens, \
+            bitboards[BISHOP] | bitboards[BLACK << 3 | BISHOP] | queens
+
+    def update_attacks(self, start_square, end_square):
+        """
+        Update slider_attacks after the bitboards moved a piece. Only the sliders that saw one of
+        the two squares, and the piece that moved, are recomputed. The previous values go to
+        attack_log for rollback_attacks
+        :param start_square: int
+        :param end_square: int
+        :return: void
+        """
+        slider_attacks = self.slider_attacks
+        log = [self.attack_maps, start_square, slider_attacks[start_square], end_square, slider_attacks[end_square]]
+        slider_attacks[start_square] = 0
+        slider_attacks[end_square] = 0
+
+        occupied = self.occupied
+        moved = (1 << start_square) | (1 << end_square)
+        orthogonal, diagonal = self.get_sliders()
+        sliders = orthogonal | diagonal
+        while sliders:
+            bit = sliders & -sliders
+            square = bit.bit_length() - 1
+            if square == end_square or slider_attacks[square] & moved:
+                if square != end_square:
+                    log.append(square)
+                    log.append(slider_attacks[square])
+                slider_attacks[square] = (rook_attacks(square, occupied) if bit & orthogonal else 0) | \
+                                         (bishop_attacks(square, occupied) if bit & diagonal else 0)
+            sliders ^= bit
+
+        # The attack maps are rebuilt from slider_attacks when they are next needed
+        self.attack_maps = [None, None]
+        self.attack_log.append(log)
+
+    def rollback_attacks(self):
+        """
+        Restore the attacks saved by the last update_attacks
+        :return: void
+        """
+        log = self.attack_log.pop()
+        self.attack_maps = log[0]
+        for i in range(len(log) - 2, 0, -2):
+            self.slider_attacks[log[i]] = log[i + 1]
+
+    def get_attack_map(self, color):
+        """
+        Every square attacked by color, leapers set-wise and sliders from slider_attacks
+        :param color: WHITE or BLACK
+        :return: bitboard
+        """
+        attacks = self.attack_maps[color]
+        if attacks is None:
+            bitboards = self.bitboards
+            code = color << 3
+            king = bitboards[code | KING]
+            attacks = pawn_attacks(bitboards[code | PAWN], color == WHITE) | knight_attacks(bitboards[code | KNIGHT])
+            if king:
+                attacks |= KING_ATTACKS[king.bit_length() - 1]
+
+            sliders = bitboards[code | BISHOP] | bitboards[code | ROOK] | bitboards[code | QUEEN]
+            while sliders:
+                bit = sliders & -sliders
+                attacks |= self.slider_attacks[bit.bit_length() - 1]
+                sliders ^= bit
+            self.attack_maps[color] = attacks
+        return attacks
+
+    def enable_stats(self):
+        """
+        Start counting calls, generated moves and pin/check scans and timing each generator,
+        see stats. Disabled, the instrumentation costs nothing
+        :return: void
+        """
+        if self.instrumentation is None:
+            from Chess.Instrumentation import Instrumentation
+            self.instrumentation = Instrumentation(self)
+            self.instrumentation.install()
+
+    def disable_stats(self):
+        """
+        Stop counting, the counters are lost
+        :return: void
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.uninstall()
+            self.instrumentation = None
+
+    def stats(self):
+        """
+        Snapshot of the counters since enable_stats: nodes (moves made), generations, moves
+        generated, Move objects built, move buffers, pin/check scans, calls and seconds by method
+        :return: dict, {"enabled": False} while disabled
+        """
+        if self.instrumentation is None:
+            return {"enabled": False}
+        return self.instrumentation.stats()
 
     def get_valid_moves(self):
         """
         Determine valid moves
         :return: list of Move
         """
-        moves = []
+        return [Move(move) for move in self.get_valid_move_codes()]
+
+    def get_valid_move_codes(self, kind=ALL_MOVES, destinations=FULL_BOARD):
+        """
+        Determine valid moves as packed ints, without building Move objects
+        Only the moves of kind are generated: the generators are given a mask of the destination
+        squares allowed (enemy pieces for CAPTURES, empty squares for QUIETS, and the checker and
+        the squares between it and the king when in check), nothing is filtered afterwards
+        The buffer belongs to the current ply and is overwritten by the next call at the same ply,
+        so it can be iterated while the moves are made and rolled back
+        :param kind: CAPTURES, QUIETS, ALL_MOVES, optionally | EVASIONS
+        :param destinations: bitboard, only the moves ending on these squares are generated
+        :return: array('I') of moves
+        """
+        ply = len(self.move_log) - self.buffer_base
+        if ply < 0:
+            # Rolled back past compact
+            self.buffer_base += ply
+            ply = 0
+        while len(self.move_buffers) <= ply:
+            self.move_buffers.append(array('I'))
+        moves = self.move_buffers[ply]
+        del moves[:]
+
         self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
 
         if self.white_turn:
             king_row = self.white_king[0]
             king_column = self.white_king[1]
+            enemies = self.occupancy[BLACK]
         else:
             king_row = self.black_king[0]
             king_column = self.black_king[1]
+            enemies = self.occupancy[WHITE]
+
+        if self.in_check and kind & EVASIONS:
+            kind = ALL_MOVES
+        if kind & ALL_MOVES == ALL_MOVES:
+            targets = FULL_BOARD
+        elif kind & CAPTURES:
+            targets = enemies
+        elif kind & QUIETS:
+            targets = ~self.occupied & FULL_BOARD
+        else:
+            return moves
+        targets &= destinations
 
+        self.king_target_mask = targets
         if self.in_check:
             if len(self.checks) == 1:
-                moves = self.get_all_possible_moves()
-                check = self.checks[0]
-                check_row = check[0]
-                check_column = check[1]
-
-                piece_checking = self.board[check_row][check_column]
-                valid_squares = []
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_column)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i, king_column + check[3] * i)
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[1] == check_column:
-                            break
-
-                for move in moves[::-1]:
-                    if move.piece_moved[1] != "K":
-                        if not (move.end_row, move.end_column) in valid_squares:
-                            moves.remove(move)
+                # Other pieces capture the checker or block between it and the king
+                checker = self.checks[0][0] * 8 + self.checks[0][1]
+                self.target_mask = targets & (BETWEEN[king_row * 8 + king_column][checker] | 1 << checker)
             else:
-                self.get_king_moves(king_row, king_column, moves)
+                self.target_mask = 0
         else:
-            moves = self.get_all_possible_moves()
+            self.target_mask = targets
 
+        if self.target_mask:
+            self.get_all_possible_moves(moves)
+        else:
+            # Only the king can move
+            self.get_king_moves(king_row, king_column, moves)
+        self.target_mask = self.king_target_mask = FULL_BOARD
         return moves
 
     def check_for_pins_and_checks(self):
@@ -113,66 +545,53 @@ class GameState:
         in_check = False
 
         if self.white_turn:
-            enemy_color = "b"
-            ally_color = "w"
+            enemy = BLACK
+            ally = WHITE
             start_row = self.white_king[0]
             start_column = self.white_king[1]
         else:
-            enemy_color = "w"
-            ally_color = "b"
+            enemy = WHITE
+            ally = BLACK
             start_row = self.black_king[0]
             start_column = self.black_king[1]
 
-        # check for all directions:
-        directions = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (1, -1), (-1, 1))
-
-        for j in range(len(directions)):
-            direction = directions[j]
-            possible_pin = ()
-            for i in range(1, 8):
-                end_row = start_row + direction[0] * i
-                end_column = start_column + direction[1] * i
-
-                if 0 <= end_row < 8 and 0 <= end_column < 8:
-                    end_piece = self.board[end_row][end_column]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():
-                            possible_pin = (end_row, end_column, direction[0], direction[1])
-                        else:
-                            break
-                    elif end_piece[0] == enemy_color:
-                        piece_type = end_piece[1]
-                        # 5 Possibilities here:
-                        # 1) Orthogonal and piece is a Rook
-                        # 2) Diagonal and piece is a Bishop
-                        # 3) 1 Square away diagonally and piece is a Pawn
-                        # 4) Any direction and piece is a Queen
-                        # 5) Any direction and piece is a King
-                        if (0 <= j <= 3 and piece_type == "R") or \
-                                (4 <= j <= 7 and piece_type == "B") or \
-                                (i == 1 and piece_type == "P" and ((enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or \
-                                (piece_type == "Q") or (i == 1 and piece_type == "K"):
-                            if possible_pin == ():
-                                in_check = True
-                                checks.append((end_row, end_column, direction[0], direction[1]))
-                                break
-                            else:
-                                pins.append(possible_pin)
-                                break
-                        else:
-                            break
-                else:
-                    break
-
-        knight_moves = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
-        for m in knight_moves:
-            end_row = start_row + m[0]
-            end_column = start_column + m[1]
-            if 0 <= end_row <= 7 and 0 <= end_column <= 7:
-                end_piece = self.board[end_row][end_column]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":
-                    in_check = True
-                    checks.append((end_row, end_column, m[0], m[1]))
+        king_square = start_row * 8 + start_column
+        occupied = self.occupied
+        allies = self.occupancy[ally]
+        enemy_code = enemy << 3
+        orthogonal = self.bitboards[enemy_code | ROOK] | self.bitboards[enemy_code | QUEEN]
+        diagonal = self.bitboards[enemy_code | BISHOP] | self.bitboards[enemy_code | QUEEN]
+
+        # Sliders: only the directions holding an enemy rook, bishop or queen are looked at
+        for direction in range(8):
+            sliders = orthogonal if direction < 4 else diagonal
+            rays = RAYS[direction]
+            ray = rays[king_square]
+            if not ray & sliders:
+                continue
+
+            positive = POSITIVE_DIRECTIONS[direction]
+            blockers = ray & occupied
+            first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            if (1 << first) & sliders:
+                checks.append(SQUARES[first] + DIRECTIONS[direction])
+            elif (1 << first) & allies:
+                blockers = rays[first] & occupied
+                if blockers:
+                    second = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                    if (1 << second) & sliders:
+                        pins.append(SQUARES[first] + DIRECTIONS[direction])
+
+        # Pawn and knight checkers only need to be found when the king is attacked
+        in_check = self.is_attacked(king_square, enemy)
+        if in_check:
+            attackers = (PAWN_ATTACKS[ally][king_square] & self.bitboards[enemy_code | PAWN]) | \
+                        (KNIGHT_ATTACKS[king_square] & self.bitboards[enemy_code | KNIGHT])
+            while attackers:
+                bit = attackers & -attackers
+                row, column = SQUARES[bit.bit_length() - 1]
+                checks.append((row, column, row - start_row, column - start_column))
+                attackers ^= bit
 
         return in_check, pins, checks
 
@@ -183,189 +602,227 @@ class GameState:
         :param column: int
         :return: boolean
         """
-        self.white_turn = not self.white_turn
-        opponent_moves = self.get_all_possible_moves()
-        self.white_turn = not self.white_turn
-        for move in opponent_moves:
-            if move.end_row == row and move.end_column == column:
-                return True
-        return False
-
-    def get_all_possible_moves(self):
-        possible_moves = []
-        for row in range(len(self.board)):
-            for column in range(len(self.board[row])):
-                turn = self.board[row][column][0]
-                if (turn == "w" and self.white_turn) or (turn == "b" and not self.white_turn):
-                    piece = self.board[row][column][1]
-                    self.move_functions[piece](row, column, possible_moves)
+        return self.is_attacked(row * 8 + column, BLACK if self.white_turn else WHITE)
+
+    def is_attacked(self, square, by_color):
+        """
+        Determine if any piece of by_color attacks square, looking outward from the square
+        for each kind of attacker instead of generating the opponent moves
+        :param square: int, row * 8 + column
+        :param by_color: WHITE or BLACK
+        :return: boolean
+        """
+        bitboards = self.bitboards
+        code = by_color << 3
+        if KNIGHT_ATTACKS[square] & bitboards[code | KNIGHT] or \
+                PAWN_ATTACKS[by_color ^ 1][square] & bitboards[code | PAWN] or \
+                KING_ATTACKS[square] & bitboards[code | KING]:
+            return True
+
+        queens = bitboards[code | QUEEN]
+        sliders = bitboards[code | ROOK] | queens
+        if ROOK_RAYS[square] & sliders and rook_attacks(square, self.occupied) & sliders:
+            return True
+        sliders = bitboards[code | BISHOP] | queens
+        return bool(BISHOP_RAYS[square] & sliders and bishop_attacks(square, self.occupied) & sliders)
+
+    def get_all_possible_moves(self, possible_moves=None):
+        """
+        Pseudo legal moves of the side to move, pins excepted, to the squares of target_mask
+        :param possible_moves: list or array('I') the moves are appended to, a new list if omitted
+        :return: possible_moves
+        """
+        if possible_moves is None:
+            possible_moves = []
+        ally = WHITE if self.white_turn else BLACK
+        pinned = 0
+        for pin in self.pins:
+            pinned |= 1 << (pin[0] * 8 + pin[1])
+
+        # Pawns that are not pinned are moved all at once, a whole bitboard per shift
+        pawns = self.bitboards[ally << 3 | PAWN] & ~pinned
+        if pawns:
+            self.get_pawn_set_moves(pawns, possible_moves)
+
+        move_functions = self.move_functions
+        squares = self.squares
+        pieces = self.occupancy[ally] ^ pawns
+        while pieces:
+            bit = pieces & -pieces
+            square = bit.bit_length() - 1
+            row, column = SQUARES[square]
+            move_functions[squares[square] & 7](self, row, column, possible_moves)
+            pieces ^= bit
 
         return possible_moves
 
+    def add_moves(self, row, column, targets, moves):
+        """
+        Append a move from (row, column) to every square of targets
+        :param row: int
+        :param column: int
+        :param targets: bitboard of destination squares
+        :param moves: list or array('I') which will append possible moves
+        :return: void
+        """
+        squares = self.squares
+        start = row * 8 + column
+        start |= squares[start] << MOVE_PIECE_SHIFT
+        while targets:
+            bit = targets & -targets
+            end = bit.bit_length() - 1
+            moves.append(start | end << MOVE_END_SHIFT | squares[end] << MOVE_CAPTURED_SHIFT)
+            targets ^= bit
+
+    def add_shifted_moves(self, targets, amount, moves):
+        """
+        Append a move to every square of targets from the square amount bits before it
+        :param targets: bitboard of destination squares
+        :param amount: int, destination square minus start square
+        :param moves: list or array('I') which will append possible moves
+        :return: void
+        """
+        squares = self.squares
+        while targets:
+            bit = targets & -targets
+            end = bit.bit_length() - 1
+            start = end - amount
+            moves.append(start | end << MOVE_END_SHIFT | squares[start] << MOVE_PIECE_SHIFT |
+                         squares[end] << MOVE_CAPTURED_SHIFT)
+            targets ^= bit
+
+    def get_pawn_set_moves(self, pawns, moves):
+        """
+        Moves for every pawn of a bitboard of unpinned pawns of the side to move
+        :param pawns: bitboard
+        :param moves: list or array('I') which will append possible moves
+        :return: void
+        """
+        empty = ~self.occupied & FULL_BOARD
+        mask = self.target_mask
+        if self.white_turn:
+            enemies = self.occupancy[BLACK] & mask
+            if empty & mask:
+                push = (pawns >> 8) & empty
+                self.add_shifted_moves(push & mask, -8, moves)
+                self.add_shifted_moves(((push & RANK_3) >> 8) & empty & mask, -16, moves)
+            if enemies:
+                self.add_shifted_moves((pawns >> 9) & NOT_FILE_H & enemies, -9, moves)
+                self.add_shifted_moves((pawns >> 7) & NOT_FILE_A & enemies, -7, moves)
+        else:
+            enemies = self.occupancy[WHITE] & mask
+            if empty & mask:
+                push = (pawns << 8) & empty
+                self.add_shifted_moves(push & mask, 8, moves)
+                self.add_shifted_moves(((push & RANK_6) << 8) & empty & mask, 16, moves)
+            if enemies:
+                self.add_shifted_moves((pawns << 7) & NOT_FILE_H & enemies, 7, moves)
+                self.add_shifted_moves((pawns << 9) & NOT_FILE_A & enemies, 9, moves)
+
     def get_pawn_moves(self, row, column, moves):
         """
         Check for possible moves for a pawn
         :param row: int
         :param column: int
-        :param moves: list of moves which will append possible moves
+        :param moves: list or array('I') which will append possible moves
         :return: void
         """
-        piece_pinned = False
-        pin_direction = ()
-
-        for pin in self.pins[::-1]:
-            if pin[0] == row and pin[1] == column:
-                piece_pinned = True
-                pin_direction = (pin[2], pin[3])
-                self.pins.remove(pin)
-                break
+        pin_direction = self.get_pin_direction(row, column)
 
-        # White moves
+        square = row * 8 + column
+        empty = ~self.occupied & FULL_BOARD
         if self.white_turn:
-            # Front + 1
-            if row != 0:
-                if self.board[row - 1][column] == "--":
-                    if not piece_pinned or pin_direction == (-1, 0):
-                        moves.append(Move((row, column), (row - 1, column), self.board))
-                        # Front + 2
-                        if row == 6 and self.board[row - 2][column] == "--":
-                            moves.append(Move((row, column), (row - 2, column), self.board))
-                # Left capture
-                if column - 1 >= 0:
-                    if not piece_pinned or pin_direction == (-1, -1):
-                        # Check if other piece is from black
-                        if self.board[row - 1][column - 1][0] == "b":
-                            moves.append(Move((row, column), (row - 1, column - 1), self.board))
-                # Right capture
-                if column + 1 <= 7:
-                    if not piece_pinned or pin_direction == (-1, 1):
-                        # Check if other piece is from black
-                        if self.board[row - 1][column + 1][0] == "b":
-                            moves.append(Move((row, column), (row - 1, column + 1), self.board))
-        # Black moves
+            ally, enemies = WHITE, self.occupancy[BLACK]
+            # Front + 1, Front + 2
+            push = ((1 << square) >> 8) & empty
+            if row == 6:
+                push |= (push >> 8) & empty
         else:
-            # Front + 1
-            if row != 7:
-                if self.board[row + 1][column] == "--":
-                    if not piece_pinned or pin_direction == (1, 0):
-                        moves.append(Move((row, column), (row + 1, column), self.board))
-                        # Front + 2
-                        if row == 1 and self.board[row + 2][column] == "--":
-                            moves.append(Move((row, column), (row + 2, column), self.board))
-                # Left capture
-                if column - 1 >= 0:
-                    if not piece_pinned or pin_direction == (1, -1):
-                        # Check if other piece is from black
-                        if self.board[row + 1][column - 1][0] == "w":
-                            moves.append(Move((row, column), (row + 1, column - 1), self.board))
-                # Right capture
-                if column + 1 <= 7:
-                    # Check if other piece is from black
-                    if not piece_pinned or pin_direction == (1, 1):
-                        if self.board[row + 1][column + 1][0] == "w":
-                            moves.append(Move((row, column), (row + 1, column + 1), self.board))
+            ally, enemies = BLACK, self.occupancy[WHITE]
+            push = ((1 << square) << 8) & empty
+            if row == 1:
+                push |= (push << 8) & empty
+
+        # Captures
+        targets = (push | (PAWN_ATTACKS[ally][square] & enemies)) & self.target_mask
+        if pin_direction is not None:
+            targets &= self.get_pin_line(square, pin_direction)
+
+        if targets:
+            self.add_moves(row, column, targets, moves)
 
     def get_rook_moves(self, row, column, moves):
         """
         Get all possible rookies move
         :param row: int
         :param column: int
-        :param moves: list of moves which will append possible moves
+        :param moves: list or array('I') which will append possible moves
         :return: void
         """
-        piece_pinned = False
-        pin_direction = ()
+        pin_direction = self.get_pin_direction(row, column)
 
-        for pin in self.pins[::-1]:
-            if pin[0] == row and pin[1] == column:
-                piece_pinned = True
-                pin_direction = (pin[2], pin[3])
-                if self.board[row][column][1] != "Q":
-                    self.pins.remove(pin)
-                break
-
-        # Possible moves
-        directions = ((-1, 0), (1, 0), (0, -1), (0, 1))
-        enemy_color = "b" if self.white_turn else "w"
-
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_column = column + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_column <= 7:
-                    if not piece_pinned or pin_direction == direction or pin_direction == (-direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_column]
-                        if end_piece == "--":
-                            moves.append(Move((row, column), (end_row, end_column), self.board))
-                        # Find an enemy piece end
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((row, column), (end_row, end_column), self.board))
-                            break
-                        # Find an ally piece end
-                        else:
-                            break
-                # End of board
-                else:
-                    break
+        square = row * 8 + column
+        allies = self.occupancy[WHITE if self.white_turn else BLACK]
+        targets = self.slider_attacks[square] & ROOK_RAYS[square] & ~allies & self.target_mask
+        if pin_direction is not None:
+            targets &= self.get_pin_line(square, pin_direction)
+
+        if targets:
+            self.add_moves(row, column, targets, moves)
 
     def get_bishop_moves(self, row, column, moves):
         """
         Get all possible bishops moves
         :param row: int
         :param column: int
-        :param moves: list of moves which will append possible moves
+        :param moves: list or array('I') which will append possible moves
         :return: void
         """
-        piece_pinned = False
-        pin_direction = ()
+        pin_direction = self.get_pin_direction(row, column)
 
-        for pin in self.pins[::-1]:
-            if pin[0] == row and pin[1] == column:
-                piece_pinned = True
-                pin_direction = (pin[2], pin[3])
-                break
-
-        directions = ((-1, -1), (1, 1), (1, -1), (-1, 1))
-        enemy_color = "b" if self.white_turn else "w"
-
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_column = column + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_column <= 7:
-                    if not piece_pinned or pin_direction == direction or pin_direction == (-direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_column]
-                        if end_piece == "--":
-                            moves.append(Move((row, column), (end_row, end_column), self.board))
-                        # Find an enemy piece end
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((row, column), (end_row, end_column), self.board))
-                            break
-                        # Find an ally piece end
-                        else:
-                            break
-                # End of board
-                else:
-                    break
+        square = row * 8 + column
+        allies = self.occupancy[WHITE if self.white_turn else BLACK]
+        targets = self.slider_attacks[square] & BISHOP_RAYS[square] & ~allies & self.target_mask
+        if pin_direction is not None:
+            targets &= self.get_pin_line(square, pin_direction)
 
-    def get_knight_moves(self, row, column, moves):
-        for pin in self.pins[::-1]:
+        if targets:
+            self.add_moves(row, column, targets, moves)
+
+    def get_pin_direction(self, row, column):
+        """
+        Direction of the pin on the piece at (row, column). pins is only read, so a queen sees
+        its pin from both get_rook_moves and get_bishop_moves
+        :param row: int
+        :param column: int
+        :return: tuple (row, column) step from the king to the piece, None if it is not pinned
+        """
+        for pin in self.pins:
             if pin[0] == row and pin[1] == column:
-                self.pins.remove(pin)
-                return
+                return pin[2], pin[3]
+        return None
 
-        x_move = [2, 1, -1, -2, -2, -1, 1, 2]
-        y_move = [1, 2, 2, 1, -1, -2, -2, -1]
+    @staticmethod
+    def get_pin_line(square, pin_direction):
+        """
+        Squares a piece pinned on square can still move to, both ways along the pin
+        :param square: int
+        :param pin_direction: tuple (row, column) step from the king to the pinned piece
+        :return: bitboard
+        """
+        direction = DIRECTION_INDEX[pin_direction]
+        return RAYS[direction][square] | RAYS[direction ^ 1][square]
 
-        color = self.board[row][column][0]
+    def get_knight_moves(self, row, column, moves):
+        # A pinned knight can never stay on the pin line
+        if self.get_pin_direction(row, column) is not None:
+            return
 
-        for knight_move in range(8):
-            new_column = column + x_move[knight_move]
-            new_row = row + y_move[knight_move]
+        allies = self.occupancy[WHITE if self.white_turn else BLACK]
+        targets = KNIGHT_ATTACKS[row * 8 + column] & ~allies & self.target_mask
 
-            if 0 <= new_column <= 7 and 0 <= new_row <= 7:
-                if self.board[new_row][new_column][0] != color:
-                    moves.append(Move((row, column), (new_row, new_column), self.board))
+        if targets:
+            self.add_moves(row, column, targets, moves)
 
     def get_queen_moves(self, row, column, moves):
         """
@@ -375,8 +832,9 @@ class GameState:
         :param moves:
         :return:
         """
-        self.get_rook_moves(row, column, moves)
-        self.get_bishop_moves(row, column, moves)
+        # The class functions, so that enable_stats does not count a queen as a rook and a bishop
+        GameState.get_rook_moves(self, row, column, moves)
+        GameState.get_bishop_moves(self, row, column, moves)
 
     def get_king_moves(self, row, column, moves):
         """
@@ -386,29 +844,39 @@ class GameState:
         :param moves:
         :return:
         """
-        color = self.board[row][column][0]
-        king_moves = ((1, 1), (1, 0), (0, 1), (-1, 1), (-1, -1), (1, -1), (0, -1), (-1, 0))
-        for move in king_moves:
-            new_row = row + move[0]
-            new_column = column + move[1]
-
-            if 0 <= new_row <= 7 and 0 <= new_column <= 7:
-                end_piece = self.board[new_row][new_column]
-                if end_piece[0] != color:
-                    if color == "w":
-                        self.white_king = (new_row, new_column)
-                    else:
-                        self.black_king = (new_row, new_column)
-                    in_check, pins, checks = self.check_for_pins_and_checks()
-                    if not in_check:
-                        moves.append(Move((row, column), (new_row, new_column), self.board))
-                    if color == "w":
-                        self.white_king = (row, column)
-                    else:
-                        self.black_king = (row, column)
-
-
-class Move:
+        if self.squares[row * 8 + column] >> 3 == WHITE:
+            ally, enemy = WHITE, BLACK
+        else:
+            ally, enemy = BLACK, WHITE
+        square = row * 8 + column
+
+        # Squares attacked by the enemy are read from its attack map
+        targets = KING_ATTACKS[square] & ~self.occupancy[ally] & ~self.get_attack_map(enemy) & self.king_target_mask
+        if self.in_check:
+            # The king shadows the squares behind it from a checking slider, they stay attacked once it steps away
+            enemy_code = enemy << 3
+            sliders = self.bitboards[enemy_code | BISHOP] | self.bitboards[enemy_code | ROOK] | \
+                self.bitboards[enemy_code | QUEEN]
+            for check in self.checks:
+                if (1 << (check[0] * 8 + check[1])) & sliders:
+                    targets &= ~RAYS[DIRECTION_INDEX[(-check[2], -check[3])]][square]
+
+        if targets:
+            self.add_moves(row, column, targets, moves)
+
+    # Generator of each piece type, pawn to king, shared by every GameState
+    move_functions = (
+        None, get_pawn_moves, get_knight_moves, get_bishop_moves, get_rook_moves, get_queen_moves, get_king_moves,
+    )
+
+
+class Move(int):
+    """
+    A move packed in an int (see MOVE_END_SHIFT and the following constants), with readable
+    fields for the UI and notation. Generators work on the plain ints, Move only wraps them
+    """
+    __slots__ = ()
+
     ranks_to_rows = {
         "1": 7,
         "2": 6,
@@ -435,19 +903,47 @@ class Move:
 
     columns_to_files = {v: k for k, v in files_to_columns.items()}
 
-    def __init__(self, start_square, end_square, board):
-        self.start_row = start_square[0]
-        self.start_column = start_square[1]
-        self.end_row = end_square[0]
-        self.end_column = end_square[1]
-        self.piece_moved = board[self.start_row][self.start_column]
-        self.piece_captured = board[self.end_row][self.end_column]
-        self.move_ID = self.start_row * 1000 + self.start_column * 100 + self.end_row * 10 + self.end_column
-
-    def __eq__(self, other):
-        if isinstance(other, Move):
-            return self.move_ID == other.move_ID
-        return False
+    def __new__(cls, start_square, end_square=None, board=None):
+        """
+        Move((row, column), (row, column), board) reads the pieces from board, Move(int) wraps a packed move
+        """
+        if end_square is None:
+            return int.__new__(cls, start_square)
+        return int.__new__(cls, start_square[0] * 8 + start_square[1] |
+                           (end_square[0] * 8 + end_square[1]) << MOVE_END_SHIFT |
+                           PIECE_CODES[board[start_square[0]][start_square[1]]] << MOVE_PIECE_SHIFT |
+                           PIECE_CODES[board[end_square[0]][end_square[1]]] << MOVE_CAPTURED_SHIFT)
+
+    @property
+    def start_row(self):
+        return (self & 63) >> 3
+
+    @property
+    def start_column(self):
+        return self & 7
+
+    @property
+    def end_row(self):
+        return (self >> MOVE_END_SHIFT + 3) & 7
+
+    @property
+    def end_column(self):
+        return (self >> MOVE_END_SHIFT) & 7
+
+    @property
+    def piece_moved(self):
+        return PIECE_NAMES[(self >> MOVE_PIECE_SHIFT) & 15]
+
+    @property
+    def piece_captured(self):
+        return PIECE_NAMES[(self >> MOVE_CAPTURED_SHIFT) & 15]
+
+    @property
+    def move_ID(self):
+        return self & 0xFFF
+
+    def __repr__(self):
+        return "Move({})".format(self.get_chess_notation())
 
     def get_chess_notation(self):
         return self.get_rank_file(self.start_row, self.start_column) + self.get_rank_file(self.end_row, self.end_column)
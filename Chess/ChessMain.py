@@ -1,27 +1,111 @@
 """
 Display
 Handle user input
+Only the squares that changed since the last frame are redrawn, over a cached board background.
+Move generation and engine searches run on a background thread, so the window keeps MAX_FPS
+pygame is only imported by main, importing this module does not need it
 """
 
-import pygame as p
-from Chess import ChessEngine
+import os
+from concurrent.futures import ThreadPoolExecutor
 
+from Chess import ChessEngine, Search
+
+# pygame, imported by import_pygame
+p = None
 
 WIDTH = HEIGHT = 512
 DIMENSION = 8  # board dimension
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15
 IMAGES = {}
+PIECES = ["wR", "wN", "wB", "wQ", "wK", "wP", "bR", "bN", "bB", "bQ", "bK", "bP"]
+IMAGES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+# Scaled sprites of every piece side by side, as raw RGBA pixels, one file per SQ_SIZE
+ATLAS_PATH = os.path.join(IMAGES_DIRECTORY, "atlas_{}.rgba")
+# Seconds the engine thinks when asked for a move with the space bar
+ENGINE_TIME = 2.0
+
+# What is drawn over a square besides its piece
+NO_HIGHLIGHT, SELECTED, POSSIBLE_MOVE = 0, 1, 2
+
+
+def import_pygame():
+    """
+    Import pygame into the module global p, once
+    :return: pygame module
+    """
+    global p
+    if p is None:
+        import pygame
+        p = pygame
+    return p
 
 
 def load_images():
     """
     :return: void
-    Set string values for images path
+    Fill IMAGES with the sprites scaled to SQ_SIZE, read from the atlas cache when it is newer
+    than the PNGs, otherwise decoded, scaled and saved to the cache
+    """
+    atlas_path = ATLAS_PATH.format(SQ_SIZE)
+    size = (SQ_SIZE * len(PIECES), SQ_SIZE)
+    atlas = None
+    sources = [os.path.join(IMAGES_DIRECTORY, piece + ".png") for piece in PIECES]
+    if os.path.exists(atlas_path) and \
+            os.path.getmtime(atlas_path) >= max(os.path.getmtime(source) for source in sources):
+        with open(atlas_path, "rb") as atlas_file:
+            pixels = atlas_file.read()
+        if len(pixels) == size[0] * size[1] * 4:
+            atlas = p.image.frombuffer(pixels, size, "RGBA")
+
+    if atlas is None:
+        atlas = p.Surface(size, p.SRCALPHA)
+        for index, source in enumerate(sources):
+            atlas.blit(p.transform.scale(p.image.load(source), (SQ_SIZE, SQ_SIZE)), (index * SQ_SIZE, 0))
+        try:
+            with open(atlas_path, "wb") as atlas_file:
+                atlas_file.write(p.image.tostring(atlas, "RGBA"))
+        except OSError:
+            # Read-only install, the sprites are scaled again on the next launch
+            pass
+
+    if p.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()
+    for index, piece in enumerate(PIECES):
+        IMAGES[piece] = atlas.subsurface(p.Rect(index * SQ_SIZE, 0, SQ_SIZE, SQ_SIZE))
+
+
+def generate_moves(snapshot):
     """
-    pieces = ["wR", "wN", "wB", "wQ", "wK", "wP", "bR", "bN", "bB", "bQ", "bK", "bP"]
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+    Valid moves of a position, run on the background thread
+    :param snapshot: bytes, see GameState.snapshot
+    :return: list of Move
+    """
+    return ChessEngine.GameState.from_snapshot(snapshot).get_valid_moves()
+
+
+def find_engine_move(snapshot, seconds):
+    """
+    Engine move of a position, run on the background thread
+    :param snapshot: bytes, see GameState.snapshot
+    :param seconds: float
+    :return: Move, None if there is no legal move
+    """
+    game_state = ChessEngine.GameState.from_snapshot(snapshot)
+    return Search.find_best_move(game_state, Search.SearchLimits(time=seconds)).move
+
+
+def index_moves(moves):
+    """
+    Valid moves grouped by start square, to highlight and check the moves of one piece
+    :param moves: list of Move
+    :return: dict (row, column) -> list of Move
+    """
+    index = {}
+    for move in moves:
+        index.setdefault((move.start_row, move.start_column), []).append(move)
+    return index
 
 
 def main():
@@ -29,21 +113,36 @@ def main():
     Main Loop in game, initialize all variables and gameState
      :return: void
     """
+    import_pygame()
     p.init()
     screen = p.display.set_mode((HEIGHT, WIDTH))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
+    background = draw_board(p.Surface((WIDTH, HEIGHT)))
     game_state = ChessEngine.GameState()
-    valid_moves = game_state.get_valid_moves()
-    move_made = True
+    # One thread per kind of job, so a long engine search never delays the highlights
+    move_worker = ThreadPoolExecutor(max_workers=1)
+    engine_worker = ThreadPoolExecutor(max_workers=1)
+
+    # Results of the background thread are only used if no move was made or rolled back since the
+    # job was submitted, position_id tells
+    position_id = 0
+    pending_moves = move_worker.submit(generate_moves, game_state.snapshot())
+    pending_moves_id = position_id
+    pending_engine_move = None
+    pending_engine_id = None
+    move_index = None
 
     load_images()
     running = True
+    # (piece, highlight) last drawn on each square, None to force a redraw
+    drawn = [None] * (DIMENSION * DIMENSION)
 
     square_selected = ()
     player_clicks = []
 
     while running:
+        move_made = False
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
@@ -52,7 +151,8 @@ def main():
                 column = location[0] // SQ_SIZE
                 row = location[1] // SQ_SIZE
 
-                if square_selected == (row, column) or (not player_clicks and game_state.board[row][column] == "--"):
+                square = row * DIMENSION + column
+                if square_selected == (row, column) or (not player_clicks and not game_state.squares[square]):
                     square_selected = ()
                     player_clicks = []
                 else:
@@ -60,8 +160,8 @@ def main():
                     player_clicks.append(square_selected)
 
                     if len(player_clicks) == 2:
-                        move = ChessEngine.Move(player_clicks[0], player_clicks[1], game_state.board)
-                        if move in valid_moves:
+                        move = find_move(move_index, player_clicks[0], player_clicks[1])
+                        if move is not None:
                             game_state.make_move(move)
                             move_made = True
                             square_selected = ()
@@ -71,55 +171,117 @@ def main():
             elif e.type == p.KEYDOWN and e.key == p.K_LEFT:
                 game_state.rollback_move()
                 move_made = True
+            elif e.type == p.KEYDOWN and e.key == p.K_SPACE and pending_engine_move is None:
+                pending_engine_move = engine_worker.submit(find_engine_move, game_state.snapshot(), ENGINE_TIME)
+                pending_engine_id = position_id
+
+        if pending_engine_move is not None and pending_engine_move.done():
+            engine_move = pending_engine_move.result()
+            if pending_engine_id == position_id and engine_move is not None:
+                game_state.make_move(engine_move)
+                move_made = True
+                square_selected = ()
+                player_clicks = []
+            pending_engine_move = None
 
         if move_made:
-            valid_moves = game_state.get_valid_moves()
-            move_made = False
+            position_id += 1
+            move_index = None
+            pending_moves = move_worker.submit(generate_moves, game_state.snapshot())
+            pending_moves_id = position_id
 
-        draw_game_state(screen, game_state, square_selected, valid_moves)
+        if pending_moves is not None and pending_moves.done():
+            if pending_moves_id == position_id:
+                move_index = index_moves(pending_moves.result())
+            pending_moves = None
+
+        dirty = draw_game_state(screen, background, game_state, square_selected, move_index, drawn)
         clock.tick(MAX_FPS)
-        p.display.flip()
+        if dirty:
+            p.display.update(dirty)
+
+    move_worker.shutdown(wait=False)
+    engine_worker.shutdown(wait=False)
 
 
-def draw_game_state(screen, game_state, square_selected, valid_moves):
+def find_move(move_index, start, end):
     """
+    :param move_index: dict from index_moves, None while the moves are being generated
+    :param start: tuple (row, column)
+    :param end: tuple (row, column)
+    :return: Move, None if it is not valid
+    """
+    if move_index is None:
+        return None
+    for move in move_index.get(start, ()):
+        if (move.end_row, move.end_column) == end:
+            return move
+    return None
+
+
+def draw_game_state(screen, background, game_state, square_selected, move_index, drawn):
+    """
+    Redraw the squares whose piece or highlight changed since the last call
     :param screen: p.screen
+    :param background: p.Surface, see draw_board
     :param game_state: GameState()
     :param square_selected: tuple of square
-    :return:
+    :param move_index: dict from index_moves, None while the moves are being generated
+    :param drawn: list of what each square shows, updated
+    :return: list of p.Rect to update
     """
-    draw_board(screen)
+    highlights = [NO_HIGHLIGHT] * (DIMENSION * DIMENSION)
     if square_selected:
-        draw_selected(screen, square_selected, p.Color(200, 0, 0, 1))
-        draw_possible_moves(screen, square_selected, valid_moves)
-    draw_pieces(screen, game_state.board)
+        highlights[square_selected[0] * DIMENSION + square_selected[1]] = SELECTED
+        if move_index is not None:
+            for move in move_index.get(square_selected, ()):
+                highlights[move.end_row * DIMENSION + move.end_column] = POSSIBLE_MOVE
+
+    dirty = []
+    for row in range(DIMENSION):
+        for column in range(DIMENSION):
+            square = row * DIMENSION + column
+            state = (ChessEngine.PIECE_NAMES[game_state.squares[square]], highlights[square])
+            if drawn[square] != state:
+                drawn[square] = state
+                dirty.append(draw_square(screen, background, row, column, state[0], state[1]))
+    return dirty
 
 
-def draw_board(screen):
+def draw_board(surface):
     """
-    :param screen: p.screen
-    :return: void
+    Paint the squares once, frames copy them from this surface
+    :param surface: p.Surface
+    :return: surface
     """
     colors = [p.Color("white"), p.Color("grey")]
 
     for row in range(DIMENSION):
         for column in range(DIMENSION):
             color = colors[((row + column) % 2)]
-            p.draw.rect(screen, color, p.Rect(column * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+            p.draw.rect(surface, color, p.Rect(column * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    return surface
 
 
-def draw_pieces(screen, board):
+def draw_square(screen, background, row, column, piece, highlight):
     """
     :param screen: p.screen
-    :param board: bidimensional list of strings which represent board
-    :return:
+    :param background: p.Surface, see draw_board
+    :param row: int
+    :param column: int
+    :param piece: str, "--" for an empty square
+    :param highlight: NO_HIGHLIGHT, SELECTED or POSSIBLE_MOVE
+    :return: p.Rect drawn
     """
-    for row in range(DIMENSION):
-        for column in range(DIMENSION):
-            piece = board[row][column]
-
-            if piece != "--":
-                screen.blit(IMAGES[piece], (column * SQ_SIZE, row * SQ_SIZE))
+    rect = p.Rect(column * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    screen.blit(background, rect, rect)
+    if highlight == SELECTED:
+        draw_selected(screen, (row, column), p.Color(200, 0, 0, 1))
+    elif highlight == POSSIBLE_MOVE:
+        draw_possible_move(screen, (row, column), p.Color(130, 130, 130))
+    if piece != "--":
+        screen.blit(IMAGES[piece], rect)
+    return rect
 
 
 def draw_selected(screen, square, color):
@@ -130,11 +292,5 @@ def draw_possible_move(screen, square, color):
     p.draw.circle(screen, color, (SQ_SIZE // 2 + square[1] * SQ_SIZE, SQ_SIZE // 2 + square[0] * SQ_SIZE), SQ_SIZE // 2)
 
 
-def draw_possible_moves(screen, square, moves):
-    for move in moves:
-        if (move.start_row, move.start_column) == square:
-            draw_possible_move(screen, (move.end_row, move.end_column), p.Color(130, 130, 130))
-
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,242 @@
+"""
+Static evaluation: material plus piece-square tables, in centipawns from white's point of view
+SQUARE_SCORES[piece code][square] already holds both, signed by color, so a position scores the sum
+of one lookup per piece. GameState keeps that sum up to date in make_move and rollback_move, and
+evaluate_batch scores many positions at once with NumPy, which is only imported when needed
+Evaluator adds the pawn structure (doubled, isolated and passed pawns), which is too slow to
+compute at every node: scores are kept in two bounded LRU caches, one keyed by the position hash
+and one by the pawn hash, since the same pawn skeleton comes back across many positions
+"""
+
+from Chess.AttackTables import FILE_A, RAYS, SQUARES
+from Chess.LRUCache import LRUCache
+
+# Piece values by piece type, pawn to king
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 0)
+
+# Pawn structure terms, in centipawns for each pawn
+DOUBLED_PAWN = -10
+ISOLATED_PAWN = -15
+# Passed pawn bonus by number of ranks advanced from the starting rank
+PASSED_PAWN = (0, 5, 10, 20, 35, 60, 100, 0)
+
+# Entries kept by the caches of Evaluator
+DEFAULT_CACHE_ENTRIES = 1 << 16
+DEFAULT_PAWN_ENTRIES = 1 << 14
+
+# Piece-square tables by piece type, from white's point of view, a8 first
+PIECE_SQUARE_TABLES = (
+    (0,) * 64,
+    (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ),
+    (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ),
+    (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ),
+    (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ),
+    (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ),
+    (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ),
+)
+
+
+def build_square_scores():
+    """
+    Material plus piece-square score of every piece code on every square, negative for black
+    Black reads the white tables upside down
+    :return: tuple of 16 tuples of 64 ints, codes without a piece score 0
+    """
+    scores = [(0,) * 64] * 16
+    for piece_type in range(1, 7):
+        table = PIECE_SQUARE_TABLES[piece_type]
+        value = PIECE_VALUES[piece_type]
+        scores[piece_type] = tuple(value + table[square] for square in range(64))
+        scores[8 | piece_type] = tuple(-value - table[square ^ 56] for square in range(64))
+    return tuple(scores)
+
+
+SQUARE_SCORES = build_square_scores()
+
+
+FILES = tuple(FILE_A << column for column in range(8))
+ADJACENT_FILES = tuple((FILES[column - 1] if column > 0 else 0) | (FILES[column + 1] if column < 7 else 0)
+                       for column in range(8))
+# PASSED_MASKS[color][square], squares ahead on the same and adjacent files that enemy pawns must not hold,
+# white = 0 moving up the board and black = 1
+PASSED_MASKS = tuple(
+    tuple(ahead[square] | (ahead[square - 1] if square & 7 else 0) | (ahead[square + 1] if square & 7 < 7 else 0)
+          for square in range(64))
+    for ahead in (RAYS[0], RAYS[1])
+)
+
+
+def evaluate_squares(squares):
+    """
+    Score of a position computed from scratch
+    :param squares: piece code on each square
+    :return: int, centipawns from white's point of view
+    """
+    return sum(SQUARE_SCORES[piece][square] for square, piece in enumerate(squares) if piece)
+
+
+def pawn_structure(white_pawns, black_pawns):
+    """
+    Doubled, isolated and passed pawns of both sides
+    :param white_pawns: bitboard
+    :param black_pawns: bitboard
+    :return: int, centipawns from white's point of view
+    """
+    score = 0
+    for color, pawns, enemies, sign in ((0, white_pawns, black_pawns, 1), (1, black_pawns, white_pawns, -1)):
+        for column in range(8):
+            on_file = pawns & FILES[column]
+            if on_file:
+                count = bin(on_file).count("1")
+                score += sign * DOUBLED_PAWN * (count - 1)
+                if not pawns & ADJACENT_FILES[column]:
+                    score += sign * ISOLATED_PAWN * count
+
+        passed_masks = PASSED_MASKS[color]
+        while pawns:
+            bit = pawns & -pawns
+            square = bit.bit_length() - 1
+            if not passed_masks[square] & enemies:
+                row = SQUARES[square][0]
+                score += sign * PASSED_PAWN[7 - row if color == 0 else row]
+            pawns ^= bit
+    return score
+
+
+class Evaluator:
+    """
+    Full evaluation: the incremental material and piece-square score of GameState plus the pawn
+    structure, cached by position and by pawn skeleton. One Evaluator can serve many searches
+    and games, the scores only depend on the position
+    """
+    def __init__(self, cache_entries=DEFAULT_CACHE_ENTRIES, pawn_entries=DEFAULT_PAWN_ENTRIES):
+        """
+        :param cache_entries: int, positions kept
+        :param pawn_entries: int, pawn structures kept
+        """
+        self.cache = LRUCache(cache_entries)
+        self.pawn_table = LRUCache(pawn_entries)
+
+    def evaluate(self, game_state):
+        """
+        Score of game_state from the side to move point of view
+        :param game_state: GameState
+        :return: int, centipawns
+        """
+        key = game_state.zobrist_key
+        score = self.cache.get(key)
+        if score is None:
+            pawn_key = game_state.pawn_key
+            pawns = self.pawn_table.get(pawn_key)
+            if pawns is None:
+                pawns = pawn_structure(game_state.bitboards[1], game_state.bitboards[9])
+                self.pawn_table.put(pawn_key, pawns)
+            score = game_state.evaluation + pawns
+            self.cache.put(key, score)
+        return score if game_state.white_turn else -score
+
+    def clear(self):
+        """
+        Empty both caches
+        :return: void
+        """
+        self.cache.clear()
+        self.pawn_table.clear()
+
+    def stats(self):
+        """
+        :return: dict with the stats of the position cache and of the pawn table
+        """
+        return {"evaluation": self.cache.stats(), "pawns": self.pawn_table.stats()}
+
+
+def import_numpy():
+    """
+    :return: the numpy module
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Batch evaluation needs NumPy: pip install numpy")
+    return numpy
+
+
+def pack_positions(positions):
+    """
+    Piece codes of many positions as an (N, 64) uint8 array
+    :param positions: iterable of GameState or of GameState.snapshot bytes
+    :return: tuple (codes, white_turn), numpy arrays of shapes (N, 64) and (N,)
+    """
+    numpy = import_numpy()
+    snapshots = b"".join(position if isinstance(position, bytes) else position.snapshot() for position in positions)
+    packed = numpy.frombuffer(snapshots, dtype=numpy.uint8).reshape(-1, 65)
+    return packed[:, :64], packed[:, 64] == 0
+
+
+def evaluate_batch(codes, white_turn=None):
+    """
+    Score every position of a batch with one table lookup per square
+    :param codes: (N, 64) array of piece codes, see pack_positions
+    :param white_turn: (N,) boolean array to score from the side to move point of view, white's if None
+    :return: (N,) int32 array of centipawns
+    """
+    numpy = import_numpy()
+    table = numpy.array(SQUARE_SCORES, dtype=numpy.int32)
+    scores = table[codes, numpy.arange(64)].sum(axis=1, dtype=numpy.int32)
+    if white_turn is not None:
+        scores = numpy.where(white_turn, scores, -scores)
+    return scores
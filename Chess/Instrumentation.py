@@ -0,0 +1,134 @@
+"""
+Opt-in counters and timers for the move generator of one GameState, see GameState.enable_stats
+Nothing is paid while disabled: enable_stats switches the GameState to a subclass whose methods are
+the counting wrappers, and disable_stats switches it back to its own class
+"""
+
+import time
+
+# Methods timed, their seconds include the methods they call
+GENERATORS = (
+    "get_pawn_set_moves", "get_pawn_moves", "get_knight_moves", "get_bishop_moves", "get_rook_moves",
+    "get_queen_moves", "get_king_moves",
+)
+TIMED = ("get_valid_move_codes", "check_for_pins_and_checks", "get_all_possible_moves", "get_attack_map") + GENERATORS
+# Methods only counted, they are too short for a timer to mean anything
+COUNTED = ("make_move", "rollback_move", "is_attacked")
+
+
+class Instrumentation:
+    """
+    Counters of one GameState
+    """
+    def __init__(self, game_state):
+        """
+        :param game_state: GameState
+        """
+        self.game_state = game_state
+        # Class of game_state given back by uninstall
+        self.original_class = type(game_state)
+        self.calls = dict.fromkeys(TIMED + COUNTED + ("get_valid_moves",), 0)
+        self.seconds = dict.fromkeys(TIMED, 0.0)
+        self.moves_generated = 0
+        self.move_objects = 0
+        self.start = time.perf_counter()
+
+    def install(self):
+        """
+        Switch game_state to a subclass of its class whose instrumented methods are counting wrappers
+        GameState has __slots__, so the wrappers cannot be set on the instance itself
+        :return: void
+        """
+        original = self.original_class
+        namespace = {"__slots__": ()}
+        for name in TIMED:
+            namespace[name] = self.timed(name, getattr(original, name))
+        for name in COUNTED:
+            namespace[name] = self.counted(name, getattr(original, name))
+        namespace["get_valid_moves"] = self.counted_moves(original.get_valid_moves)
+
+        codes = namespace["get_valid_move_codes"]
+
+        def get_valid_move_codes(*args):
+            moves = codes(*args)
+            self.moves_generated += len(moves)
+            return moves
+        namespace["get_valid_move_codes"] = get_valid_move_codes
+        # The dispatch table of get_all_possible_moves holds the plain functions, it is wrapped too
+        namespace["move_functions"] = tuple(None if function is None else self.timed(function.__name__, function)
+                                            for function in original.move_functions)
+        self.game_state.__class__ = type("Instrumented" + original.__name__, (original,), namespace)
+
+    def uninstall(self):
+        """
+        Give game_state its class back
+        :return: void
+        """
+        self.game_state.__class__ = self.original_class
+
+    def timed(self, name, method):
+        """
+        :param name: str
+        :param method: function taking the GameState first
+        :return: function counting and timing method
+        """
+        calls = self.calls
+        seconds = self.seconds
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            calls[name] += 1
+            start = clock()
+            result = method(*args)
+            seconds[name] += clock() - start
+            return result
+        wrapper.__name__ = name
+        return wrapper
+
+    def counted(self, name, method):
+        """
+        :param name: str
+        :param method: function taking the GameState first
+        :return: function counting method
+        """
+        calls = self.calls
+
+        def wrapper(*args):
+            calls[name] += 1
+            return method(*args)
+        wrapper.__name__ = name
+        return wrapper
+
+    def counted_moves(self, method):
+        """
+        :param method: GameState.get_valid_moves
+        :return: function counting the Move objects it builds
+        """
+        calls = self.calls
+
+        def get_valid_moves(game_state):
+            calls["get_valid_moves"] += 1
+            moves = method(game_state)
+            self.move_objects += len(moves)
+            return moves
+        return get_valid_moves
+
+    def stats(self):
+        """
+        :return: dict, see GameState.stats
+        """
+        calls = self.calls
+        generations = calls["get_valid_move_codes"]
+        return {
+            "enabled": True,
+            "seconds": time.perf_counter() - self.start,
+            "nodes": calls["make_move"],
+            "generations": generations,
+            "moves_generated": self.moves_generated,
+            "move_objects": self.move_objects,
+            "move_buffers": len(self.game_state.move_buffers),
+            "pin_check_scans": calls["check_for_pins_and_checks"],
+            "scans_per_generation": calls["check_for_pins_and_checks"] / generations if generations else 0.0,
+            "calls": dict(calls),
+            "time": dict(self.seconds),
+        }
@@ -0,0 +1,70 @@
+"""
+Bounded least recently used cache with hit counters, shared by the evaluation caches of Evaluator
+and the move cache of the game server
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded map, the least recently used entry is evicted when full
+    """
+    def __init__(self, max_entries):
+        """
+        :param max_entries: int
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def clear(self):
+        """
+        Empty the cache and reset its counters
+        :return: void
+        """
+        self.entries.clear()
+        self.probes = self.hits = self.stores = self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key: hashable, a position hash in this package
+        :return: value, None if key is not in the cache
+        """
+        self.probes += 1
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        :param key: hashable, not in the cache
+        :param value: anything but None, which get returns for a missing key
+        :return: void
+        """
+        self.stores += 1
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        :return: dict of the counters and of the hit rate
+        """
+        return {
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.probes - self.hits,
+            "hit_rate": round(self.hits / self.probes, 4) if self.probes else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+        }
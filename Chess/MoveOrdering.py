@@ -0,0 +1,141 @@
+"""
+Move ordering for the search: the order in which the moves of a node are tried decides how much
+alpha-beta prunes, since a cutoff found on the first move skips all the others
+Moves are handed out in stages: the hash move, captures by MVV-LVA, the killer moves of the ply,
+then the quiet moves by history score. Each stage is only built when the previous one is exhausted,
+and within a stage only the best move is picked before the rest is sorted, so a node cut off by
+its first moves does not pay for ordering the others
+"""
+
+from Chess.ChessEngine import MOVE_CAPTURED_SHIFT, MOVE_END_SHIFT, MOVE_PIECE_SHIFT
+
+# Stages of MoveOrdering, disabled ones leave their moves in generation order
+HASH_MOVE = 1
+CAPTURES = 2
+KILLERS = 4
+HISTORY = 8
+ALL_STAGES = HASH_MOVE | CAPTURES | KILLERS | HISTORY
+
+# Killer moves kept per ply
+KILLER_SLOTS = 2
+
+
+def capture_order(move):
+    """
+    MVV-LVA sort key of a capture: victim type first, then the cheapest attacker
+    :param move: int
+    :return: int
+    """
+    return ((move >> MOVE_CAPTURED_SHIFT) & 7) << 3 | 7 - ((move >> MOVE_PIECE_SHIFT) & 7)
+
+
+def history_index(move):
+    """
+    :param move: int
+    :return: int, piece code moved * 64 + destination square
+    """
+    return ((move >> MOVE_PIECE_SHIFT) & 15) << 6 | (move >> MOVE_END_SHIFT) & 63
+
+
+def pick_best(moves, key):
+    """
+    Yield moves best first: the best one is found with a single pass, the others are only sorted
+    if the caller asks for a second move
+    :param moves: list of int, emptied as it goes
+    :param key: function of a move, higher is tried first
+    :return: generator of int
+    """
+    if not moves:
+        return
+    best = max(moves, key=key)
+    yield best
+    moves.remove(best)
+    moves.sort(key=key, reverse=True)
+    yield from moves
+
+
+class MoveOrdering:
+    """
+    Killer and history tables of one search, and the staged move picker that reads them
+    """
+    def __init__(self, max_ply=64, stages=ALL_STAGES):
+        """
+        :param max_ply: int, deepest ply killers are kept for
+        :param stages: int, HASH_MOVE | CAPTURES | KILLERS | HISTORY, to measure each of them
+        """
+        self.stages = stages
+        self.killers = [[0] * KILLER_SLOTS for _ in range(max_ply + 1)]
+        # Indexed by history_index, raised by depth * depth each time a quiet move cuts off
+        self.history = [0] * (16 * 64)
+
+    def clear(self):
+        """
+        Forget the killers and the history
+        :return: void
+        """
+        for killers in self.killers:
+            killers[:] = [0] * KILLER_SLOTS
+        self.history = [0] * (16 * 64)
+
+    def pick_moves(self, moves, ply, table_move=0):
+        """
+        Yield the moves of a node in search order
+        :param moves: sequence of int, read again once the captures are exhausted, left untouched
+        :param ply: int, distance from the root
+        :param table_move: int, move of the transposition table, 0 if none
+        :return: generator of int
+        """
+        stages = self.stages
+        if not stages & HASH_MOVE or table_move not in moves:
+            table_move = 0
+        if table_move:
+            yield table_move
+
+        if stages & CAPTURES:
+            yield from pick_best([move for move in moves if (move >> MOVE_CAPTURED_SHIFT) & 15 and move != table_move],
+                                 capture_order)
+            # Only reached when no capture cut off
+            quiets = [move for move in moves if not (move >> MOVE_CAPTURED_SHIFT) & 15 and move != table_move]
+        else:
+            quiets = [move for move in moves if move != table_move]
+
+        if stages & KILLERS:
+            for killer in self.killers[ply]:
+                if killer and killer in quiets:
+                    quiets.remove(killer)
+                    yield killer
+
+        if stages & HISTORY:
+            history = self.history
+            yield from pick_best(quiets, lambda move: history[history_index(move)])
+        else:
+            yield from quiets
+
+    def pick_captures(self, moves):
+        """
+        Captures of a quiescence node by MVV-LVA whatever the stages, quiet moves are left out
+        Unordered captures make the quiescence search explode
+        :param moves: iterable of int
+        :return: generator of int
+        """
+        return pick_best([move for move in moves if (move >> MOVE_CAPTURED_SHIFT) & 15], capture_order)
+
+    def add_cutoff(self, move, ply, depth):
+        """
+        Remember a quiet move that caused a beta cutoff as a killer of ply and in the history
+        Captures are already tried early and are not recorded
+        :param move: int
+        :param ply: int
+        :param depth: int, plies left at the node
+        :return: void
+        """
+        if (move >> MOVE_CAPTURED_SHIFT) & 15:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            if move in killers:
+                killers.remove(move)
+            else:
+                killers.pop()
+            killers.insert(0, move)
+        self.history[history_index(move)] += depth * depth
@@ -0,0 +1,233 @@
+"""
+Opening book: a sorted file of fixed width entries read through mmap, looked up by binary search
+Entries follow the Polyglot layout, 16 bytes big-endian: 64 bit position key, 16 bit move, 16 bit
+weight and 32 bits left for learning. The key is GameState.hash and the move holds the start and
+end squares of the packed move (its low 12 bits), so the files are not interchangeable with real
+Polyglot books. Nothing is loaded in memory, a lookup reads a few pages of the file whatever its size
+
+book = OpeningBook("book.bin")
+book.get_book_moves(game_state), book.choose_move(game_state)
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+
+from Chess.ChessEngine import Move
+from Chess.replay import ReplayError, find_game_move, read_games, start_game
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+# Entries of the temporary runs of build_book: key, move and a 32 bit count
+RUN_ENTRY = struct.Struct(">QHI")
+MOVE_MASK = 0xFFF
+MAX_WEIGHT = 0xFFFF
+# Plies of each game entered in a book by default
+DEFAULT_BOOK_PLIES = 20
+# Distinct (position, move) pairs counted in memory before build_book spills them to a run
+DEFAULT_RUN_ENTRIES = 1 << 20
+
+
+class OpeningBook:
+    """
+    A book file opened read-only, see the module documentation for the format
+    """
+    def __init__(self, path):
+        """
+        :param path: str, file written by build_book
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError("{} is not a book: {} bytes is not a whole number of entries".format(path, size))
+        self.count = size // ENTRY.size
+        # mmap refuses empty files, an empty book has no entry to read anyway
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        """
+        :return: void
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """
+        Index of the first entry of key, by binary search
+        :param key: int
+        :return: int, where key would be inserted if it is not in the book
+        """
+        data = self.data
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) >> 1
+            if KEY.unpack_from(data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        """
+        :param key: int
+        :return: list of tuples (book move, weight), book moves are start | end << 6
+        """
+        data = self.data
+        found = []
+        for index in range(self.find(key), self.count):
+            entry_key, move, weight, _ = ENTRY.unpack_from(data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+        return found
+
+    def get_book_moves(self, game_state):
+        """
+        Book moves of the position that are valid in it, heaviest first
+        :param game_state: GameState
+        :return: list of tuples (Move, weight), empty out of book
+        """
+        entries = self.entries(game_state.hash)
+        if not entries:
+            return []
+        valid = {move & MOVE_MASK: move for move in game_state.get_valid_move_codes()}
+        moves = [(Move(valid[move]), weight) for move, weight in entries if move in valid and weight]
+        moves.sort(key=lambda entry: entry[1], reverse=True)
+        return moves
+
+    def choose_move(self, game_state, generator=None):
+        """
+        :param game_state: GameState
+        :param generator: random.Random to draw a move in proportion to its weight, the heaviest
+        move is returned if None
+        :return: Move, None out of book
+        """
+        moves = self.get_book_moves(game_state)
+        if not moves:
+            return None
+        if generator is None:
+            return moves[0][0]
+        pick = generator.randrange(sum(weight for _, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+
+
+class BookStats:
+    """
+    Counters of build_book
+    """
+    def __init__(self):
+        self.games = 0
+        self.positions = 0
+        self.failed = 0
+        self.runs = 0
+        self.entries = 0
+
+    def __repr__(self):
+        return "games {} positions {} failed {} runs {} entries {}".format(
+            self.games, self.positions, self.failed, self.runs, self.entries)
+
+
+def write_run(counts):
+    """
+    Sort counts into a temporary file
+    :param counts: dict key << 16 | move -> count
+    :return: file object, rewound
+    """
+    run = tempfile.TemporaryFile()
+    for entry in sorted(counts):
+        run.write(RUN_ENTRY.pack(entry >> 16, entry & 0xFFFF, counts[entry]))
+    run.seek(0)
+    return run
+
+
+def read_run(run, block_entries=4096):
+    """
+    :param run: file object from write_run
+    :param block_entries: int, entries read at once
+    :return: generator of tuples (key, move, count), in order
+    """
+    while True:
+        block = run.read(RUN_ENTRY.size * block_entries)
+        if not block:
+            return
+        yield from RUN_ENTRY.iter_unpack(block)
+
+
+def build_book(lines, path, notation=None, max_plies=DEFAULT_BOOK_PLIES, run_entries=DEFAULT_RUN_ENTRIES,
+               stats=None, errors=None):
+    """
+    Write a book of the first max_plies moves of every game of an archive, weighted by how often
+    each move was played. Games are streamed through GameState.make_move, and the counts spill to
+    sorted runs on disk every run_entries pairs, which are merged into the book
+    :param lines: iterable of str, PGN or UCI move lists, see replay.read_games
+    :param path: str, book file written
+    :param notation: "pgn", "uci" or None to guess
+    :param max_plies: int
+    :param run_entries: int
+    :param stats: BookStats updated as the games go
+    :param errors: function called with each ReplayError, the rest of that game is skipped
+    :return: BookStats
+    """
+    if stats is None:
+        stats = BookStats()
+    game_state = None
+    counts = {}
+    runs = []
+    for game in read_games(lines, notation):
+        stats.games += 1
+        try:
+            game_state = start_game(game, game_state)
+            for text in game.moves[:max_plies]:
+                move = find_game_move(game, game_state, text)
+                entry = game_state.hash << 16 | move & MOVE_MASK
+                counts[entry] = counts.get(entry, 0) + 1
+                stats.positions += 1
+                game_state.make_move(move)
+        except ReplayError as error:
+            # The moves counted before the error are kept
+            stats.failed += 1
+            if errors is not None:
+                errors(error)
+
+        if len(counts) >= run_entries:
+            runs.append(write_run(counts))
+            counts = {}
+    if counts or not runs:
+        runs.append(write_run(counts))
+    stats.runs = len(runs)
+
+    with open(path, "wb") as book:
+        previous = None
+        weight = 0
+        for key, move, count in heapq.merge(*(read_run(run) for run in runs)):
+            if (key, move) != previous:
+                if previous is not None:
+                    book.write(ENTRY.pack(previous[0], previous[1], min(weight, MAX_WEIGHT), 0))
+                    stats.entries += 1
+                previous = (key, move)
+                weight = 0
+            weight += count
+        if previous is not None:
+            book.write(ENTRY.pack(previous[0], previous[1], min(weight, MAX_WEIGHT), 0))
+            stats.entries += 1
+    for run in runs:
+        run.close()
+    return stats
@@ -0,0 +1,125 @@
+"""
+Perft and search split over the root moves across a process pool
+Workers receive a GameState.snapshot (65 bytes) and one root move, never a pickled GameState.
+Results are merged in root move order, so they do not depend on which worker finishes first
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import Search
+from Chess.ChessEngine import GameState, Move
+from Chess.perft import perft
+from Chess.TranspositionTable import TranspositionTable
+
+# Transposition table of each root move search, small because a worker searches one subtree
+WORKER_TABLE_MB = 4
+
+
+def perft_worker(position, move, depth):
+    """
+    Leaf nodes below one root move
+    :param position: bytes, see GameState.snapshot
+    :param move: int
+    :param depth: int, depth below the root
+    :return: int
+    """
+    game_state = GameState.from_snapshot(position)
+    game_state.make_move(move)
+    return perft(game_state, depth - 1)
+
+
+def search_worker(position, move, depth, deadline, max_nodes=None):
+    """
+    Full window search of one root move
+    :param position: bytes, see GameState.snapshot
+    :param move: int
+    :param depth: int, depth below the root
+    :param deadline: float, time.time() the search must stop at, None for no limit
+    :param max_nodes: int, nodes the search must stop at, None for no limit
+    :return: tuple (score from the root point of view, nodes, pv below move), score None if aborted
+    """
+    remaining = None if deadline is None else deadline - time.time()
+    if remaining is not None and remaining <= 0:
+        return None, 0, []
+    game_state = GameState.from_snapshot(position)
+    searcher = Search.Searcher(game_state, Search.SearchLimits(time=remaining, nodes=max_nodes),
+                               TranspositionTable(WORKER_TABLE_MB))
+    if remaining is not None:
+        searcher.deadline = time.perf_counter() + remaining
+    game_state.make_move(move)
+    try:
+        score = -searcher.negamax(depth - 1, 1, -Search.MATE_SCORE - 1, Search.MATE_SCORE + 1)
+    except Search.SearchAborted:
+        return None, searcher.nodes, []
+    return score, searcher.nodes, list(searcher.pv_table[1])
+
+
+def parallel_perft(game_state, depth, workers=None):
+    """
+    perft with each root move counted by a worker
+    :param game_state: GameState
+    :param depth: int, at least 1
+    :param workers: int, processes, os.cpu_count() if None
+    :return: tuple (nodes, list of tuples (Move, nodes) in generation order)
+    """
+    position = game_state.snapshot()
+    moves = list(game_state.get_valid_move_codes())
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(perft_worker, [position] * len(moves), moves, [depth] * len(moves)))
+    divided = [(Move(move), nodes) for move, nodes in zip(moves, counts)]
+    return sum(counts), divided
+
+
+def parallel_search(game_state, limits=None, workers=None, info=None):
+    """
+    Iterative deepening where each iteration searches every root move in a worker with a full window
+    The best score wins, ties going to the move generated first
+    :param game_state: GameState
+    :param limits: SearchLimits, a depth 4 search if omitted. The nodes left are shared equally by
+    the root moves of each iteration, the iteration a root move runs out in is abandoned
+    :param workers: int, processes, os.cpu_count() if None
+    :param info: function called with the SearchResult of every completed iteration
+    :return: SearchResult
+    """
+    if limits is None:
+        limits = Search.SearchLimits(depth=4)
+    start = time.perf_counter()
+    deadline = None if limits.time is None else time.time() + limits.time
+    position = game_state.snapshot()
+    moves = list(game_state.get_valid_move_codes())
+    if not moves:
+        score = -Search.MATE_SCORE if game_state.in_check else 0
+        return Search.SearchResult(None, score, 0, 0, time.perf_counter() - start, [])
+
+    result = Search.SearchResult(Move(moves[0]), 0, 0, 0, 0.0, [Move(moves[0])])
+    nodes = 0
+    max_depth = min(limits.depth or Search.MAX_DEPTH, Search.MAX_DEPTH)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for depth in range(1, max_depth + 1):
+            move_nodes = None
+            if limits.nodes is not None:
+                move_nodes = (limits.nodes - nodes) // len(moves)
+                if move_nodes <= 0:
+                    break
+            outcomes = list(executor.map(search_worker, [position] * len(moves), moves,
+                                         [depth] * len(moves), [deadline] * len(moves), [move_nodes] * len(moves)))
+            nodes += sum(outcome[1] for outcome in outcomes)
+            if any(outcome[0] is None for outcome in outcomes):
+                break
+
+            best = 0
+            for index, outcome in enumerate(outcomes):
+                if outcome[0] > outcomes[best][0]:
+                    best = index
+            score, _, pv = outcomes[best]
+            result = Search.SearchResult(Move(moves[best]), score, depth, nodes, time.perf_counter() - start,
+                                         [Move(moves[best])] + [Move(move) for move in pv])
+            if info is not None:
+                info(result)
+            if abs(score) >= Search.MATE_SCORE - Search.MAX_DEPTH:
+                break
+
+    result.nodes = nodes
+    result.seconds = time.perf_counter() - start
+    return result
@@ -0,0 +1,349 @@
+"""
+Move search over GameState: negamax with alpha-beta pruning, iterative deepening and a capture-only
+quiescence search, stopped by a depth, wall-clock or node budget. Results are kept in a
+TranspositionTable, and positions are scored by an Evaluator, both of which can be passed in to be
+reused across searches. Moves are tried in the order of MoveOrdering: hash move, captures, killers,
+then history
+
+best = find_best_move(game_state, SearchLimits(time=2.0))
+best.move, best.score, best.depth, best.nodes, best.nps, best.pv
+"""
+
+import time
+
+from Chess.ChessEngine import CAPTURES, EVASIONS, Move
+from Chess.Evaluation import Evaluator
+from Chess.MoveOrdering import MoveOrdering
+from Chess.TranspositionTable import EXACT, LOWER, UPPER, TranspositionTable
+
+MATE_SCORE = 100000
+MAX_DEPTH = 64
+# The clock and the stop flag are looked at once every CHECK_INTERVAL + 1 nodes
+CHECK_INTERVAL = 255
+# Seconds between two calls of the progress function of Searcher.search
+PROGRESS_INTERVAL = 1.0
+
+
+class SearchLimits:
+    """
+    Budget of a search, None meaning unlimited. Without any limit the search goes to MAX_DEPTH
+    """
+    def __init__(self, depth=None, time=None, nodes=None):
+        """
+        :param depth: int, deepest iteration
+        :param time: float, seconds of wall-clock time
+        :param nodes: int, nodes to search
+        """
+        self.depth = depth
+        self.time = time
+        self.nodes = nodes
+
+
+class SearchResult:
+    """
+    Outcome of the deepest iteration searched
+    """
+    def __init__(self, move, score, depth, nodes, seconds, pv):
+        """
+        :param move: Move, None when there is no legal move
+        :param score: int, centipawns from the side to move point of view
+        :param depth: int, depth of the last completed iteration
+        :param nodes: int, nodes searched over every iteration
+        :param seconds: float
+        :param pv: list of Move, principal variation
+        """
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.pv = pv
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.seconds) if self.seconds > 0 else 0
+
+    def __repr__(self):
+        return "SearchResult(move={}, score={}, depth={}, nodes={}, nps={}, pv={})".format(
+            self.move, self.score, self.depth, self.nodes, self.nps, " ".join(str(move) for move in self.pv))
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when the budget runs out
+    """
+
+
+class Searcher:
+    """
+    Keeps the state of one search: budget, node counter and principal variation
+    """
+    def __init__(self, game_state, limits, table=None, ordering=None, evaluator=None):
+        """
+        :param game_state: GameState, left as it was found when the search returns
+        :param limits: SearchLimits
+        :param table: TranspositionTable, a new one if omitted
+        :param ordering: MoveOrdering, a new one with every stage if omitted
+        :param evaluator: Evaluator, a new one if omitted
+        """
+        self.game_state = game_state
+        self.limits = limits
+        self.table = table if table is not None else TranspositionTable()
+        self.table.new_search()
+        self.ordering = ordering if ordering is not None else MoveOrdering(MAX_DEPTH)
+        self.evaluator = evaluator if evaluator is not None else Evaluator()
+        self.nodes = 0
+        self.max_nodes = limits.nodes if limits.nodes is not None else float("inf")
+        self.deadline = None
+        # Set from another thread by stop
+        self.stopped = False
+        self.progress = None
+        self.start = None
+        self.next_progress = None
+        self.root_ply = len(game_state.move_log)
+        # pv_table[ply] is the best line found from ply
+        self.pv_table = [[] for _ in range(MAX_DEPTH + 1)]
+
+    def stop(self):
+        """
+        Ask a running search to return as soon as possible, it can be called from another thread
+        :return: void
+        """
+        self.stopped = True
+
+    def search(self, info=None, progress=None):
+        """
+        Iterative deepening until the budget runs out or stop is called
+        :param info: function called with the SearchResult of every completed iteration
+        :param progress: function called with (nodes, seconds) every PROGRESS_INTERVAL seconds
+        :return: SearchResult
+        """
+        game_state = self.game_state
+        limits = self.limits
+        start = self.start = time.perf_counter()
+        if limits.time is not None:
+            self.deadline = start + limits.time
+        self.progress = progress
+        self.next_progress = start + PROGRESS_INTERVAL
+
+        root_moves = list(game_state.get_valid_move_codes())
+        if not root_moves:
+            score = -MATE_SCORE if game_state.in_check else 0
+            return SearchResult(None, score, 0, 0, time.perf_counter() - start, [])
+        root_moves = list(self.ordering.pick_moves(root_moves, 0))
+
+        result = SearchResult(Move(root_moves[0]), 0, 0, 0, 0.0, [Move(root_moves[0])])
+        max_depth = min(limits.depth or MAX_DEPTH, MAX_DEPTH)
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.search_root(root_moves, depth)
+            except SearchAborted:
+                while len(game_state.move_log) > self.root_ply:
+                    game_state.rollback_move()
+                break
+
+            pv = self.pv_table[0]
+            result = SearchResult(Move(pv[0]), score, depth, self.nodes, time.perf_counter() - start,
+                                  [Move(move) for move in pv])
+            if info is not None:
+                info(result)
+
+            # The best move so far is searched first by the next iteration
+            root_moves.remove(pv[0])
+            root_moves.insert(0, pv[0])
+            if abs(score) >= MATE_SCORE - MAX_DEPTH:
+                break
+
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def search_root(self, root_moves, depth):
+        """
+        :param root_moves: list of moves, searched in that order
+        :param depth: int
+        :return: int, score of the best move
+        """
+        game_state = self.game_state
+        alpha = -MATE_SCORE - 1
+        beta = MATE_SCORE + 1
+        self.nodes += 1
+        for move in root_moves:
+            game_state.make_move(move)
+            score = -self.negamax(depth - 1, 1, -beta, -alpha)
+            game_state.rollback_move()
+            if score > alpha:
+                alpha = score
+                self.pv_table[0] = [move] + self.pv_table[1]
+        return alpha
+
+    def negamax(self, depth, ply, alpha, beta):
+        """
+        :param depth: int, plies left before the quiescence search
+        :param ply: int, distance from the root
+        :param alpha: int
+        :param beta: int
+        :return: int, score from the side to move point of view
+        """
+        if depth <= 0:
+            self.pv_table[ply] = []
+            return self.quiescence(ply, alpha, beta)
+
+        self.count_node()
+        game_state = self.game_state
+        self.pv_table[ply] = []
+        key = game_state.hash
+        entry = self.table.probe(key)
+        table_move = 0
+        if entry is not None:
+            table_move, score, entry_depth, bound = entry
+            if entry_depth >= depth:
+                score = score_from_table(score, ply)
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    if table_move:
+                        self.pv_table[ply] = [table_move]
+                    return score
+
+        moves = game_state.get_valid_move_codes()
+        if not moves:
+            return -MATE_SCORE + ply if game_state.in_check else 0
+        if ply >= MAX_DEPTH:
+            return self.evaluator.evaluate(game_state)
+
+        original_alpha = alpha
+        best_move = 0
+        for move in self.ordering.pick_moves(moves, ply, table_move):
+            game_state.make_move(move)
+            score = -self.negamax(depth - 1, ply + 1, -beta, -alpha)
+            game_state.rollback_move()
+            if score >= beta:
+                self.ordering.add_cutoff(move, ply, depth)
+                self.table.store(key, depth, score_to_table(score, ply), LOWER, move)
+                return score
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+        self.table.store(key, depth, score_to_table(alpha, ply), EXACT if alpha > original_alpha else UPPER, best_move)
+        return alpha
+
+    def quiescence(self, ply, alpha, beta):
+        """
+        Search captures only until the position is quiet, so the evaluation is not taken in the
+        middle of an exchange. Every move is searched when in check. Captures are searched most
+        valuable victim first, least valuable attacker first, which keeps the tree small
+        Only the captures are generated out of check, so stalemates are not seen here
+        :param ply: int
+        :param alpha: int
+        :param beta: int
+        :return: int
+        """
+        self.count_node()
+        game_state = self.game_state
+        moves = game_state.get_valid_move_codes(CAPTURES | EVASIONS)
+        in_check = game_state.in_check
+        if in_check:
+            if not moves:
+                return -MATE_SCORE + ply
+        else:
+            stand_pat = self.evaluator.evaluate(game_state)
+            if stand_pat >= beta or ply >= MAX_DEPTH:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = self.ordering.pick_captures(moves)
+
+        for move in moves:
+            game_state.make_move(move)
+            score = -self.quiescence(ply + 1, -beta, -alpha)
+            game_state.rollback_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def stats(self):
+        """
+        Counters of the transposition table and of the evaluation caches
+        :return: dict
+        """
+        stats = {"nodes": self.nodes, "table": self.table.stats()}
+        stats.update(self.evaluator.stats())
+        return stats
+
+    def count_node(self):
+        """
+        Count a node and abort the search when the budget is spent
+        :return: void
+        """
+        self.nodes += 1
+        if self.nodes >= self.max_nodes:
+            raise SearchAborted()
+        if self.nodes & CHECK_INTERVAL == 0:
+            self.check_budget()
+
+    def check_budget(self):
+        """
+        Abort the search when it was stopped or its time is up, and report progress
+        :return: void
+        """
+        if self.stopped:
+            raise SearchAborted()
+        if self.deadline is None and self.progress is None:
+            return
+        now = time.perf_counter()
+        if self.deadline is not None and now >= self.deadline:
+            raise SearchAborted()
+        if self.progress is not None and now >= self.next_progress:
+            self.next_progress = now + PROGRESS_INTERVAL
+            self.progress(self.nodes, now - self.start)
+
+
+def score_to_table(score, ply):
+    """
+    Mate scores are stored as distance from the position instead of from the root
+    :param score: int
+    :param ply: int
+    :return: int
+    """
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score + ply
+    if score <= MAX_DEPTH - MATE_SCORE:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """
+    Inverse of score_to_table
+    :param score: int
+    :param ply: int
+    :return: int
+    """
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score - ply
+    if score <= MAX_DEPTH - MATE_SCORE:
+        return score + ply
+    return score
+
+
+def find_best_move(game_state, limits=None, info=None, table=None, evaluator=None, book=None):
+    """
+    Search game_state for the best move within limits
+    :param game_state: GameState, restored before returning
+    :param limits: SearchLimits, a depth 4 search if omitted
+    :param info: function called with the SearchResult of every completed iteration
+    :param table: TranspositionTable kept between searches, a new one if omitted
+    :param evaluator: Evaluator kept between searches, a new one if omitted
+    :param book: OpeningBook, its heaviest move is played without searching when the position is in it
+    :return: SearchResult, the best move of the deepest completed iteration, of depth 0 for a book move
+    """
+    if book is not None:
+        start = time.perf_counter()
+        move = book.choose_move(game_state)
+        if move is not None:
+            return SearchResult(move, 0, 0, 0, time.perf_counter() - start, [move])
+    if limits is None:
+        limits = SearchLimits(depth=4)
+    return Searcher(game_state, limits, table, evaluator=evaluator).search(info)
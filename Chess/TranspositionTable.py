@@ -0,0 +1,106 @@
+"""
+Fixed-size transposition table keyed by GameState.hash
+Entries live in parallel arrays instead of a dict of Python objects, 18 bytes each:
+key (Q), best move (I), score (i) and depth << 8 | age << 2 | bound (H)
+The table holds as many buckets of two entries as fit in its memory cap: the first keeps the deepest
+result of the current search, the second always takes what the first one refused
+"""
+
+from array import array
+
+# Bound types, never 0 so an empty entry has info 0
+EXACT, LOWER, UPPER = 1, 2, 3
+ENTRY_BYTES = 18
+DEFAULT_SIZE_MB = 16
+
+
+class TranspositionTable:
+    """
+    Stores depth, score, bound type and best move of searched positions in bounded memory
+    """
+    def __init__(self, size_mb=DEFAULT_SIZE_MB):
+        """
+        :param size_mb: float, memory cap in megabytes, the table uses at most that much
+        """
+        self.buckets = max(1, int(size_mb * (1 << 20)) // (2 * ENTRY_BYTES))
+        self.size = self.buckets * 2
+        self.age = 0
+        self.keys = array('Q', bytes(8 * self.size))
+        self.moves = array('I', bytes(4 * self.size))
+        self.scores = array('i', bytes(4 * self.size))
+        self.infos = array('H', bytes(2 * self.size))
+        self.counters = {"probes": 0, "hits": 0, "misses": 0, "stores": 0, "overwrites": 0}
+
+    def new_search(self):
+        """
+        Age the entries of the previous searches, so they are the first to be replaced
+        :return: void
+        """
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        """
+        Empty the table and reset the counters
+        :return: void
+        """
+        self.keys = array('Q', bytes(8 * self.size))
+        self.infos = array('H', bytes(2 * self.size))
+        self.age = 0
+        for name in self.counters:
+            self.counters[name] = 0
+
+    def probe(self, key):
+        """
+        :param key: int, position hash
+        :return: tuple (move, score, depth, bound), None on a miss
+        """
+        counters = self.counters
+        counters["probes"] += 1
+        index = (key % self.buckets) << 1
+        for slot in (index, index + 1):
+            info = self.infos[slot]
+            if info and self.keys[slot] == key:
+                counters["hits"] += 1
+                return self.moves[slot], self.scores[slot], info >> 8, info & 3
+        counters["misses"] += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Save a search result. The first entry of the bucket is replaced by the same position,
+        a deeper or equal search or any search when it comes from an older one; otherwise the
+        result goes to the second entry
+        :param key: int, position hash
+        :param depth: int, 0 to 255
+        :param score: int
+        :param bound: EXACT, LOWER or UPPER
+        :param move: int, packed best move, 0 if none
+        :return: void
+        """
+        infos = self.infos
+        keys = self.keys
+        slot = (key % self.buckets) << 1
+        info = infos[slot]
+        if info and keys[slot] != key and info >> 8 > depth and (info >> 2) & 63 == self.age:
+            slot += 1
+            info = infos[slot]
+
+        counters = self.counters
+        counters["stores"] += 1
+        if info and keys[slot] != key:
+            counters["overwrites"] += 1
+        keys[slot] = key
+        self.moves[slot] = move
+        self.scores[slot] = score
+        infos[slot] = depth << 8 | self.age << 2 | bound
+
+    def stats(self):
+        """
+        Counters since the last clear, with the table size and how full it is
+        :return: dict
+        """
+        stats = dict(self.counters)
+        stats["entries"] = self.size
+        stats["size_mb"] = self.size * ENTRY_BYTES / (1 << 20)
+        stats["filled"] = self.size - self.infos.count(0)
+        return stats
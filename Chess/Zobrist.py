@@ -0,0 +1,46 @@
+"""
+Zobrist keys, drawn once at import time from a seeded generator so keys are the same on every run
+A position's key is the XOR of the keys of its pieces and of the side to move. GameState keeps it
+up to date with a few XORs per move, see GameState.hash. The pawn key only XORs the pawns, for
+tables of pawn structure scores
+"""
+
+import random
+
+_random = random.Random(0x5EED)
+
+# PIECE_KEYS[piece code][square]; codes 0, 7, 8 and 15 are unused, their keys are never read
+PIECE_KEYS = tuple(tuple(_random.getrandbits(64) for _ in range(64)) for _ in range(16))
+# XORed in when black is to move
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+# Reserved for the castling and en passant rules, which GameState does not implement yet:
+# one key per 4 bit castling rights mask and one per en passant file
+CASTLING_KEYS = tuple(_random.getrandbits(64) for _ in range(16))
+EN_PASSANT_KEYS = tuple(_random.getrandbits(64) for _ in range(8))
+
+
+def compute_hash(squares, white_turn):
+    """
+    Key of a position, computed from scratch
+    :param squares: piece code on each square
+    :param white_turn: boolean
+    :return: int
+    """
+    key = 0 if white_turn else BLACK_TO_MOVE_KEY
+    for square, piece in enumerate(squares):
+        if piece:
+            key ^= PIECE_KEYS[piece][square]
+    return key
+
+
+def compute_pawn_hash(squares):
+    """
+    Key of the pawns of a position, computed from scratch
+    :param squares: piece code on each square
+    :return: int
+    """
+    key = 0
+    for square, piece in enumerate(squares):
+        if piece & 7 == 1:
+            key ^= PIECE_KEYS[piece][square]
+    return key
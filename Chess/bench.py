@@ -0,0 +1,572 @@
+"""
+Benchmark the move generator
+Walk the game tree from the starting position through make_move, rollback_move and get_valid_move_codes
+and report nodes per second. Leaf nodes are counted from the length of the move list (bulk counting),
+so the figure is dominated by the move generator
+
+python -m Chess.bench --depth 4
+python -m Chess.bench --depth 3 --alloc
+python -m Chess.bench --search 5
+python -m Chess.bench --depth 4 --scaling 1,2,4,8
+python -m Chess.bench --startup
+python -m Chess.bench --ordering 4
+python -m Chess.bench --evasions 2000
+python -m Chess.bench --profile
+python -m Chess.bench --server 1000
+"""
+
+import argparse
+import asyncio
+import cProfile
+import gc
+import json
+import os
+import pstats
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from Chess import ChessEngine, MoveOrdering, Parallel, Search, server
+from Chess.Evaluation import Evaluator
+from Chess.perft import REFERENCE_POSITIONS, perft
+from Chess.TranspositionTable import TranspositionTable
+
+# Move ordering stages measured by measure_ordering, each adding one to the previous
+ORDERING_STAGES = (
+    ("hash move", MoveOrdering.HASH_MOVE),
+    ("+ MVV-LVA captures", MoveOrdering.HASH_MOVE | MoveOrdering.CAPTURES),
+    ("+ killers", MoveOrdering.HASH_MOVE | MoveOrdering.CAPTURES | MoveOrdering.KILLERS),
+    ("+ history", MoveOrdering.ALL_STAGES),
+)
+# Reference positions searched by measure_ordering, the ones without castling or promotions nearby
+ORDERING_POSITIONS = ("start", "position 3", "position 6")
+
+# (reference position, perft depth) walked by --profile
+PROFILE_POSITIONS = (("start", 4), ("position 3", 4), ("position 6", 3), ("discovered check", 4))
+
+# Code timed by measure_startup in a fresh interpreter, after its setup, the interpreter prints the seconds
+STARTUP_TIMER = "import sys, time\n{}\nstart = time.perf_counter()\n{}\nprint(time.perf_counter() - start)"
+GUI_SETUP = "ChessMain.import_pygame().init()\nChessMain.p.display.set_mode((ChessMain.WIDTH, ChessMain.HEIGHT))"
+# (name, setup, timed code), the headless imports check pygame stays out
+STARTUP_CASES = (
+    ("import Chess.ChessEngine", "", "import Chess.ChessEngine\nassert 'pygame' not in sys.modules"),
+    ("import Chess.ChessMain", "", "from Chess import ChessMain\nassert 'pygame' not in sys.modules"),
+    ("GUI startup", "", "from Chess import ChessMain\n" + GUI_SETUP + "\nChessMain.load_images()"),
+    ("load_images", "from Chess import ChessMain\n" + GUI_SETUP, "ChessMain.load_images()"),
+)
+
+# Random plies of every game of --server, and the requests each of its clients sends
+SERVER_PLIES = 30
+SERVER_REQUESTS = 2000
+
+
+def run(depth, repeat):
+    """
+    Count the tree with perft repeat times and keep the fastest run
+    :param depth: int
+    :param repeat: int
+    :return: tuple (nodes, seconds)
+    """
+    best = None
+    nodes = 0
+    for _ in range(repeat):
+        game_state = ChessEngine.GameState()
+        start = time.perf_counter()
+        nodes = perft(game_state, depth)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return nodes, best
+
+
+def collect_positions(depth):
+    """
+    Every position up to depth plies from the start, as move sequences
+    :param depth: int
+    :return: list of tuples of moves
+    """
+    game_state = ChessEngine.GameState()
+    positions = [()]
+    frontier = [()]
+    for _ in range(depth):
+        next_frontier = []
+        for line in frontier:
+            for move in line:
+                game_state.make_move(move)
+            for move in game_state.get_valid_move_codes():
+                next_frontier.append(line + (move,))
+            for _ in line:
+                game_state.rollback_move()
+        positions.extend(next_frontier)
+        frontier = next_frontier
+    return positions
+
+
+def measure_allocations(depth):
+    """
+    Memory and garbage collections per generated move, for Move objects against packed moves
+    Generates the moves of every position up to depth plies, keeping the results alive
+    :param depth: int
+    :return: dict name -> (generated moves, bytes per move, gen 0 collections per 1000 moves)
+    """
+    game_state = ChessEngine.GameState()
+    positions = collect_positions(depth)
+    results = {}
+    generators = (
+        ("Move objects", game_state.get_valid_moves),
+        ("packed ints", lambda: array('I', game_state.get_valid_move_codes())),
+    )
+    for name, generate in generators:
+        kept = []
+        count = 0
+        gc.collect()
+        collections = gc.get_stats()[0]["collections"]
+        tracemalloc.start()
+        for line in positions:
+            for move in line:
+                game_state.make_move(move)
+            moves = generate()
+            count += len(moves)
+            kept.append(moves)
+            for _ in line:
+                game_state.rollback_move()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        collections = gc.get_stats()[0]["collections"] - collections
+        results[name] = (count, size / count, 1000 * collections / count)
+        del kept
+    return results
+
+
+def measure_scaling(depth, worker_counts):
+    """
+    Time parallel perft and a parallel search of the starting position for each number of workers
+    :param depth: int, perft depth, the search goes one ply shallower
+    :param worker_counts: list of int
+    :return: list of tuples (workers, perft seconds, search seconds)
+    """
+    timings = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        Parallel.parallel_perft(ChessEngine.GameState(), depth, workers)
+        perft_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        Parallel.parallel_search(ChessEngine.GameState(), Search.SearchLimits(depth=max(1, depth - 1)), workers)
+        timings.append((workers, perft_seconds, time.perf_counter() - start))
+    return timings
+
+
+def collect_checks(count, seed=0):
+    """
+    Positions in check met along random games from the start
+    :param count: int
+    :param seed: int
+    :return: list of GameState
+    """
+    generator = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game_state = ChessEngine.GameState()
+        for _ in range(200):
+            moves = game_state.get_valid_move_codes()
+            if not moves:
+                break
+            if game_state.in_check:
+                positions.append(ChessEngine.GameState.from_snapshot(game_state.snapshot()))
+            game_state.make_move(generator.choice(moves))
+    return positions[:count]
+
+
+def filter_evasions(game_state):
+    """
+    Valid moves in check the way get_valid_move_codes found them before the evasion mask: every
+    pseudo legal move, then the ones not blocking or capturing the checker removed one by one
+    :param game_state: GameState in check
+    :return: list of moves
+    """
+    game_state.in_check, game_state.pins, game_state.checks = game_state.check_for_pins_and_checks()
+    king_row, king_column = game_state.white_king if game_state.white_turn else game_state.black_king
+    moves = []
+    if len(game_state.checks) > 1:
+        game_state.get_king_moves(king_row, king_column, moves)
+        return moves
+
+    game_state.get_all_possible_moves(moves)
+    check_row, check_column, row_step, column_step = game_state.checks[0]
+    if game_state.squares[check_row * 8 + check_column] & 7 == ChessEngine.KNIGHT:
+        valid_squares = [check_row * 8 + check_column]
+    else:
+        valid_squares = []
+        for i in range(1, 8):
+            valid_square = (king_row + row_step * i) * 8 + king_column + column_step * i
+            valid_squares.append(valid_square)
+            if valid_square == check_row * 8 + check_column:
+                break
+    for move in moves[::-1]:
+        if (move >> ChessEngine.MOVE_PIECE_SHIFT) & 7 != ChessEngine.KING:
+            if not (move >> ChessEngine.MOVE_END_SHIFT) & 63 in valid_squares:
+                moves.remove(move)
+    return moves
+
+
+def measure_evasions(count, repeat):
+    """
+    Time the valid moves of positions in check, generated through the evasion mask and through
+    filter_evasions, after checking both give the same moves
+    :param count: int, positions
+    :param repeat: int, the fastest run is kept
+    :return: tuple (moves, mask seconds, filter seconds)
+    """
+    positions = collect_checks(count)
+    moves = 0
+    for game_state in positions:
+        expected = sorted(game_state.get_valid_move_codes())
+        if sorted(filter_evasions(game_state)) != expected:
+            raise AssertionError("evasions differ in {}".format(game_state.to_fen()))
+        moves += len(expected)
+
+    timings = []
+    for generate in (lambda game_state: game_state.get_valid_move_codes(), filter_evasions):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for game_state in positions:
+                generate(game_state)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        timings.append(best)
+    return moves, timings[0], timings[1]
+
+
+def measure_ordering(depth):
+    """
+    Nodes and time to search ORDERING_POSITIONS to a fixed depth with each set of ORDERING_STAGES
+    :param depth: int
+    :return: list of tuples (name, nodes, seconds)
+    """
+    fens = [fen for name, fen, _ in REFERENCE_POSITIONS if name in ORDERING_POSITIONS]
+    results = []
+    for name, stages in ORDERING_STAGES:
+        nodes = 0
+        start = time.perf_counter()
+        for fen in fens:
+            searcher = Search.Searcher(ChessEngine.GameState.from_fen(fen), Search.SearchLimits(depth=depth),
+                                       TranspositionTable(), MoveOrdering.MoveOrdering(Search.MAX_DEPTH, stages))
+            nodes += searcher.search().nodes
+        results.append((name, nodes, time.perf_counter() - start))
+    return results
+
+
+def measure_startup(repeat):
+    """
+    Import and GUI startup times, each the fastest of repeat fresh interpreters
+    The GUI runs on SDL's dummy video driver and is timed without, then with, the sprite atlas cache
+    :param repeat: int
+    :return: list of tuples (name, seconds)
+    """
+    from Chess import ChessMain
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    atlas_path = ChessMain.ATLAS_PATH.format(ChessMain.SQ_SIZE)
+
+    def best(setup, code, before=None):
+        timings = []
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            output = subprocess.run([sys.executable, "-c", STARTUP_TIMER.format(setup, code)], cwd=root,
+                                    env=environment, check=True, stdout=subprocess.PIPE,
+                                    universal_newlines=True).stdout
+            timings.append(float(output.split()[-1]))
+        return min(timings)
+
+    def remove_atlas():
+        if os.path.exists(atlas_path):
+            os.remove(atlas_path)
+
+    results = [(name, best(setup, code)) for name, setup, code in STARTUP_CASES[:2]]
+    for name, setup, code in STARTUP_CASES[2:]:
+        results.append((name + ", scaled from the PNGs", best(setup, code, remove_atlas)))
+        results.append((name + ", atlas cache", best(setup, code)))
+    return results
+
+
+def profile_workload(instrument=False):
+    """
+    perft of every PROFILE_POSITIONS
+    :param instrument: boolean, enable_stats on each position
+    :return: list of tuples (name, GameState.stats())
+    """
+    fens = {name: fen for name, fen, _ in REFERENCE_POSITIONS}
+    results = []
+    for name, depth in PROFILE_POSITIONS:
+        game_state = ChessEngine.GameState.from_fen(fens[name])
+        if instrument:
+            game_state.enable_stats()
+        perft(game_state, depth)
+        results.append((name, game_state.stats()))
+    return results
+
+
+def collapse_stacks(function):
+    """
+    Run function under a profile hook that charges the time spent in every function, children
+    excluded, to its whole call stack
+    :param function: function without arguments
+    :return: dict "outer;...;inner" -> seconds, the collapsed stack format of flame graph tools
+    """
+    stacks = {}
+    # [path, start, seconds spent in children]
+    stack = []
+    clock = time.perf_counter
+
+    def profile(frame, event, argument):
+        now = clock()
+        if event == "call" or event == "c_call":
+            if event == "call":
+                code = frame.f_code
+                name = "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+            else:
+                name = "builtin:{}".format(getattr(argument, "__qualname__", argument))
+            path = stack[-1][0] + ";" + name if stack else name
+            stack.append([path, now, 0.0])
+        elif stack:
+            path, start, children = stack.pop()
+            elapsed = now - start
+            stacks[path] = stacks.get(path, 0.0) + elapsed - children
+            if stack:
+                stack[-1][2] += elapsed
+
+    sys.setprofile(profile)
+    try:
+        function()
+    finally:
+        sys.setprofile(None)
+    return stacks
+
+
+def run_profile(prefix):
+    """
+    Profile profile_workload three ways: cProfile statistics saved to prefix.pstats, collapsed stacks
+    saved to prefix.collapsed (microseconds, for flamegraph.pl or speedscope) and GameState.stats
+    :param prefix: str, path of the files without extension
+    :return: list of tuples (name, GameState.stats())
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(profile_workload)
+    profiler.dump_stats(prefix + ".pstats")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+    stacks = collapse_stacks(profile_workload)
+    with open(prefix + ".collapsed", "w") as collapsed:
+        for path, seconds in sorted(stacks.items()):
+            microseconds = int(seconds * 1e6)
+            if microseconds:
+                collapsed.write("{} {}\n".format(path, microseconds))
+    return profile_workload(instrument=True)
+
+
+def request(game_server, **fields):
+    """
+    :param game_server: server.GameServer
+    :param fields: the request
+    :return: dict, the answer
+    """
+    return json.loads(game_server.answer(json.dumps(fields)))
+
+
+def measure_server_memory(games, seed=0):
+    """
+    Memory held per game by a GameServer, each game played SERVER_PLIES random plies through the
+    protocol, against GameStates played the same way and left as they are after the moves
+    :param games: int
+    :param seed: int
+    :return: tuple (bytes per server game, bytes per plain GameState, bytes of the move cache)
+    """
+    rng = random.Random(seed)
+    game_server = server.GameServer(max_games=games)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(games):
+        game = request(game_server, op="new")["game"]
+        for _ in range(SERVER_PLIES):
+            moves = request(game_server, op="moves", game=game)["moves"]
+            if not moves:
+                break
+            request(game_server, op="move", game=game, move=rng.choice(moves))
+    with_cache = tracemalloc.get_traced_memory()[0] - before
+    game_server.move_cache.clear()
+    gc.collect()
+    served = tracemalloc.get_traced_memory()[0] - before
+
+    rng = random.Random(seed)
+    before = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for _ in range(games):
+        game_state = ChessEngine.GameState()
+        for _ in range(SERVER_PLIES):
+            moves = game_state.get_valid_move_codes()
+            if not moves:
+                break
+            game_state.make_move(moves[rng.randrange(len(moves))])
+        kept.append(game_state)
+    plain = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return served / games, plain / games, with_cache - served
+
+
+async def load_server(clients, requests, seed=0):
+    """
+    Clients connected over a Unix socket, TCP where there is none, each playing random games
+    through the protocol until it has sent its requests. The clients run in the same process and
+    on the same event loop as the server, their JSON work is counted too
+    :param clients: int
+    :param requests: int, sent by each client
+    :param seed: int
+    :return: tuple (requests answered, seconds, GameServer)
+    """
+    game_server = server.GameServer()
+    directory = tempfile.mkdtemp()
+    if hasattr(asyncio, "start_unix_server"):
+        path = os.path.join(directory, "server.sock")
+        listener = await server.start(game_server, unix=path)
+        connect = lambda: asyncio.open_unix_connection(path)
+    else:
+        listener = await server.start(game_server, port=0)
+        port = listener.sockets[0].getsockname()[1]
+        connect = lambda: asyncio.open_connection(server.DEFAULT_HOST, port)
+
+    async def client(index):
+        rng = random.Random(seed + index)
+        reader, writer = await connect()
+
+        async def send(**fields):
+            writer.write((json.dumps(fields) + "\n").encode())
+            await writer.drain()
+            return json.loads(await reader.readline())
+
+        sent = 0
+        while sent < requests:
+            game = (await send(op="new"))["game"]
+            sent += 1
+            for _ in range(SERVER_PLIES):
+                moves = (await send(op="moves", game=game))["moves"]
+                sent += 1
+                if not moves or sent >= requests:
+                    break
+                await send(op="move", game=game, move=rng.choice(moves))
+                sent += 1
+            await send(op="close", game=game)
+            sent += 1
+        writer.close()
+        return sent
+
+    start = time.perf_counter()
+    sent = await asyncio.gather(*(client(index) for index in range(clients)))
+    seconds = time.perf_counter() - start
+    listener.close()
+    await listener.wait_closed()
+    if hasattr(asyncio, "start_unix_server"):
+        os.remove(path)
+    os.rmdir(directory)
+    return sum(sent), seconds, game_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move generator benchmark")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--alloc", action="store_true", help="measure memory and GC pressure per generated move")
+    parser.add_argument("--search", type=float, metavar="SECONDS", help="search the starting position instead")
+    parser.add_argument("--hash", type=float, default=16, metavar="MB", help="transposition table size of --search")
+    parser.add_argument("--scaling", metavar="WORKERS", help="time the process pool, e.g. 1,2,4,8")
+    parser.add_argument("--startup", action="store_true", help="time the engine and GUI imports and GUI startup")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                        help="write PREFIX.pstats and PREFIX.collapsed and print the generator stats")
+    parser.add_argument("--evasions", type=int, metavar="POSITIONS", help="time move generation in check")
+    parser.add_argument("--ordering", type=int, metavar="DEPTH", help="nodes to reach DEPTH by move ordering stage")
+    parser.add_argument("--server", type=int, metavar="GAMES", help="memory per game and requests per second of the "
+                                                                    "game server")
+    parser.add_argument("--clients", type=int, default=16, help="connections of --server")
+    args = parser.parse_args()
+
+    if args.server is not None:
+        served, plain, cache = measure_server_memory(args.server)
+        print("{} games of {} plies: {:.0f} bytes per game, {:.0f} games per GB".format(
+            args.server, SERVER_PLIES, served, (1 << 30) / served))
+        print("GameState kept after its moves: {:.0f} bytes per game, {:.0f} games per GB".format(
+            plain, (1 << 30) / plain))
+        print("move cache: {:.0f} bytes".format(cache))
+        answered, seconds, game_server = asyncio.run(load_server(args.clients, SERVER_REQUESTS))
+        print("{} clients: {} requests in {:.3f}s, {:.0f} requests/s".format(
+            args.clients, answered, seconds, answered / seconds))
+        print("move cache {}".format(game_server.move_cache.stats()))
+        return
+
+    if args.profile is not None:
+        for name, stats in run_profile(args.profile):
+            print("{}: {} nodes, {} generations, {} moves, {} pin/check scans, {} Move objects".format(
+                name, stats["nodes"], stats["generations"], stats["moves_generated"], stats["pin_check_scans"],
+                stats["move_objects"]))
+            for method, seconds in sorted(stats["time"].items(), key=lambda item: -item[1]):
+                print("    {:28} {:8} calls {:8.3f}s".format(method, stats["calls"][method], seconds))
+        print("wrote {0}.pstats and {0}.collapsed".format(args.profile))
+        return
+
+    if args.evasions is not None:
+        moves, mask_seconds, filter_seconds = measure_evasions(args.evasions, args.repeat)
+        print("{} positions in check, {} moves".format(args.evasions, moves))
+        print("evasion mask: {:.1f}us per position".format(mask_seconds / args.evasions * 1e6))
+        print("generate and filter: {:.1f}us per position (x{:.2f})".format(
+            filter_seconds / args.evasions * 1e6, filter_seconds / mask_seconds))
+        return
+
+    if args.ordering is not None:
+        results = measure_ordering(args.ordering)
+        for name, nodes, seconds in results:
+            print("{}: {} nodes ({:.1f}% fewer) {:.3f}s".format(
+                name, nodes, 100 - 100 * nodes / results[0][1], seconds))
+        return
+
+    if args.startup:
+        for name, seconds in measure_startup(args.repeat):
+            print("{}: {:.1f}ms".format(name, seconds * 1000))
+        return
+
+    if args.scaling:
+        timings = measure_scaling(args.depth, [int(workers) for workers in args.scaling.split(",")])
+        for workers, perft_seconds, search_seconds in timings:
+            print("workers {} perft {:.3f}s (x{:.2f}) search {:.3f}s (x{:.2f})".format(
+                workers, perft_seconds, timings[0][1] / perft_seconds, search_seconds, timings[0][2] / search_seconds))
+        return
+
+    if args.search is not None:
+        table = TranspositionTable(args.hash)
+        evaluator = Evaluator()
+        result = Search.find_best_move(ChessEngine.GameState(), Search.SearchLimits(time=args.search), info=print,
+                                       table=table, evaluator=evaluator)
+        print("bestmove {} nodes {} time {:.3f}s nps {}".format(result.move, result.nodes, result.seconds, result.nps))
+        print("transposition table {}".format(table.stats()))
+        for name, stats in evaluator.stats().items():
+            print("{} cache {}".format(name, stats))
+        return
+
+    if args.alloc:
+        for name, (count, size, collections) in measure_allocations(args.depth).items():
+            print("{}: {} moves, {:.1f} bytes/move, {:.2f} gen0 collections per 1000 moves".format(
+                name, count, size, collections))
+        return
+
+    nodes, seconds = run(args.depth, args.repeat)
+    print("depth {} nodes {} time {:.3f}s nps {:.0f}".format(args.depth, nodes, seconds, nodes / seconds))
+
+
+if __name__ == '__main__':
+    main()
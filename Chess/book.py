@@ -0,0 +1,58 @@
+"""
+Build and query opening books, see OpeningBook
+
+python -m Chess.book build games.pgn book.bin --plies 20
+python -m Chess.book probe book.bin --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b - - 0 1"
+"""
+
+import argparse
+import sys
+import time
+
+from Chess.ChessEngine import GameState
+from Chess.OpeningBook import DEFAULT_BOOK_PLIES, DEFAULT_RUN_ENTRIES, OpeningBook, build_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opening book builder and lookup")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    build = commands.add_parser("build", help="write a book from PGN or UCI games")
+    build.add_argument("games", help="archive to read, - for stdin")
+    build.add_argument("book", help="book file to write")
+    build.add_argument("--format", choices=("pgn", "uci"), help="guessed from the first line if omitted")
+    build.add_argument("--plies", type=int, default=DEFAULT_BOOK_PLIES, help="moves of each game kept")
+    build.add_argument("--run-entries", type=int, default=DEFAULT_RUN_ENTRIES,
+                       help="pairs counted in memory before spilling to disk")
+    build.add_argument("--errors", action="store_true", help="print the games that could not be replayed")
+
+    probe = commands.add_parser("probe", help="print the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", help="starting position if omitted")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stream = sys.stdin if args.games == "-" else open(args.games)
+        errors = (lambda error: print(error, file=sys.stderr)) if args.errors else None
+        start = time.perf_counter()
+        try:
+            stats = build_book(stream, args.book, args.format, args.plies, args.run_entries, errors=errors)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        print("{} time {:.3f}s".format(stats, time.perf_counter() - start), file=sys.stderr)
+        return
+
+    game_state = GameState.from_fen(args.fen) if args.fen else GameState()
+    with OpeningBook(args.book) as book:
+        moves = book.get_book_moves(game_state)
+        total = sum(weight for _, weight in moves)
+        for move, weight in moves:
+            print("{} {} {:.1f}%".format(move.get_chess_notation(), weight, 100 * weight / total))
+        if not moves:
+            print("out of book")
+
+
+if __name__ == '__main__':
+    main()
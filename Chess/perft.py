@@ -0,0 +1,187 @@
+"""
+perft: count the leaf nodes of the game tree through make_move, rollback_move and get_valid_move_codes
+Checks the move generator against reference counts and reports its speed. Every run is appended to
+a JSON history, and compared with the previous run of the same position and depth
+
+python -m Chess.perft --depth 4
+python -m Chess.perft --fen "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1" --depth 3 --divide
+python -m Chess.perft --suite
+python -m Chess.perft --depth 5 --workers 4
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+from Chess import ChessEngine
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# (name, fen, {depth: nodes}). The published counts of these positions go deeper, but deeper
+# levels contain castling, en passant or promotions, which GameState does not implement yet
+REFERENCE_POSITIONS = (
+    ("start", START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", {1: 6}),
+    ("position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", {1: 6}),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    ("discovered check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+)
+
+DEFAULT_HISTORY = "perft_history.json"
+
+
+def perft(game_state, depth):
+    """
+    Count the leaf nodes depth plies below the position, the last ply from the length of the move list
+    :param game_state: GameState
+    :param depth: int
+    :return: int
+    """
+    moves = game_state.get_valid_move_codes()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        game_state.make_move(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.rollback_move()
+    return nodes
+
+
+def divide(game_state, depth):
+    """
+    Leaf nodes below each root move
+    :param game_state: GameState
+    :param depth: int, at least 1
+    :return: list of tuples (Move, nodes)
+    """
+    counts = []
+    for move in list(game_state.get_valid_move_codes()):
+        game_state.make_move(move)
+        counts.append((ChessEngine.Move(move), perft(game_state, depth - 1)))
+        game_state.rollback_move()
+    return counts
+
+
+def timed_perft(fen, depth, show_divide=False, workers=None):
+    """
+    Run perft on a position and time it
+    :param fen: str
+    :param depth: int
+    :param show_divide: boolean, print the count of each root move
+    :param workers: int, split the root moves across that many processes, None to stay in this one
+    :return: tuple (nodes, seconds)
+    """
+    game_state = ChessEngine.GameState.from_fen(fen)
+    start = time.perf_counter()
+    if workers is not None and depth >= 1:
+        # Imported here, Parallel imports this module
+        from Chess import Parallel
+        nodes, counts = Parallel.parallel_perft(game_state, depth, workers)
+        seconds = time.perf_counter() - start
+        if show_divide:
+            for move, move_nodes in sorted(counts, key=lambda count: count[0].get_chess_notation()):
+                print("{}: {}".format(move.get_chess_notation(), move_nodes))
+        return nodes, seconds
+    if show_divide and depth >= 1:
+        counts = divide(game_state, depth)
+        seconds = time.perf_counter() - start
+        for move, nodes in sorted(counts, key=lambda count: count[0].get_chess_notation()):
+            print("{}: {}".format(move.get_chess_notation(), nodes))
+        return sum(nodes for _, nodes in counts), seconds
+    nodes = perft(game_state, depth)
+    return nodes, time.perf_counter() - start
+
+
+def load_history(path):
+    """
+    :param path: str
+    :return: list of dict, empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return json.load(history_file)
+
+
+def record(history, fen, depth, nodes, seconds, expected):
+    """
+    Append a run to history and print how it compares with the previous run of the same position and depth
+    :param history: list of dict
+    :param fen: str
+    :param depth: int
+    :param nodes: int
+    :param seconds: float
+    :param expected: int, None if there is no reference count
+    :return: void
+    """
+    previous = None
+    for entry in history:
+        if entry["fen"] == fen and entry["depth"] == depth:
+            previous = entry
+    nps = nodes / seconds if seconds > 0 else 0
+    if previous is not None:
+        changed = "" if previous["nodes"] == nodes else ", node count changed from {}".format(previous["nodes"])
+        print("  previous run {}: {:.0f} nps ({:+.1%}){}".format(
+            previous["date"], previous["nps"], nps / previous["nps"] - 1 if previous["nps"] else 0, changed))
+    history.append({
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(seconds, 4),
+        "nps": round(nps),
+        "expected": expected,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move generator node counts")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count of each root move")
+    parser.add_argument("--suite", action="store_true", help="check every reference position")
+    parser.add_argument("--workers", type=int, help="split the root moves across a process pool")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON file the results are appended to")
+    parser.add_argument("--no-history", action="store_true")
+    args = parser.parse_args()
+
+    history = [] if args.no_history else load_history(args.history)
+    failures = 0
+    if args.suite:
+        runs = [(name, fen, depth, nodes)
+                for name, fen, counts in REFERENCE_POSITIONS for depth, nodes in sorted(counts.items())]
+    else:
+        expected = None
+        for _, fen, counts in REFERENCE_POSITIONS:
+            if fen.split()[:2] == args.fen.split()[:2]:
+                expected = counts.get(args.depth)
+        runs = [("", args.fen, args.depth, expected)]
+
+    for name, fen, depth, expected in runs:
+        nodes, seconds = timed_perft(fen, depth, args.divide and not args.suite, args.workers)
+        status = ""
+        if expected is not None:
+            status = "ok" if nodes == expected else "FAILED, expected {}".format(expected)
+            failures += nodes != expected
+        print("{}depth {} nodes {} time {:.3f}s nps {:.0f} {}".format(
+            name + " " if name else "", depth, nodes, seconds, nodes / seconds if seconds > 0 else 0, status))
+        if not args.no_history:
+            record(history, fen, depth, nodes, seconds, expected)
+
+    if not args.no_history:
+        with open(args.history, "w") as history_file:
+            json.dump(history, history_file, indent=1)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+Replay game archives through the engine, one game at a time
+Reads PGN (SAN moves) or UCI move lists (one game per line of coordinate moves) from a file or stdin,
+checks every move against get_valid_move_codes and emits the positions lazily. Only the current game
+is held in memory, whatever the size of the archive
+
+python -m Chess.replay games.pgn --output fen > positions.txt
+cat games.txt | python -m Chess.replay --format uci
+"""
+
+import argparse
+import itertools
+import re
+import sys
+import time
+
+from Chess.ChessEngine import (
+    ALL_MOVES, CAPTURES, KING, MOVE_PIECE_SHIFT, PAWN, QUIETS, GameState, Move,
+)
+
+PIECE_LETTERS = {"P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(=?[NBRQ])?[+#]?[!?]*$")
+UCI_PATTERN = re.compile(r"^([a-h][1-8])([a-h][1-8])([qrbn])?$")
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+START = GameState().snapshot()
+
+
+class ReplayError(ValueError):
+    """
+    A move that is unreadable, illegal or ambiguous in its position
+    """
+
+
+class UnsupportedMove(ReplayError):
+    """
+    Castling, en passant or promotion, which GameState does not implement yet
+    """
+
+
+class Game:
+    """
+    One game of an archive: its tags and its moves, in SAN or in coordinate notation
+    """
+    def __init__(self, number, tags, moves, notation):
+        """
+        :param number: int, position of the game in the archive, from 1
+        :param tags: dict of PGN tag pairs, empty for UCI move lists
+        :param moves: list of str
+        :param notation: "san" or "uci"
+        """
+        self.number = number
+        self.tags = tags
+        self.moves = moves
+        self.notation = notation
+
+
+class ReplayStats:
+    """
+    Counters of a replay, see replay_archive
+    """
+    def __init__(self):
+        self.games = 0
+        self.moves = 0
+        self.failed = 0
+        self.unsupported = 0
+        self.start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    def __repr__(self):
+        seconds = self.seconds
+        return "games {} moves {} failed {} unsupported {} time {:.3f}s {:.1f} games/s {:.0f} moves/s".format(
+            self.games, self.moves, self.failed, self.unsupported, seconds,
+            self.games / seconds if seconds > 0 else 0, self.moves / seconds if seconds > 0 else 0)
+
+
+def square_index(name):
+    """
+    :param name: str, e.g. "e4"
+    :return: int, row * 8 + column
+    """
+    return Move.ranks_to_rows[name[1]] * 8 + Move.files_to_columns[name[0]]
+
+
+def clean_movetext(movetext):
+    """
+    Remove comments, variations, annotations, move numbers and the result from PGN movetext
+    :param movetext: str
+    :return: list of SAN moves
+    """
+    movetext = re.sub(r"\{[^}]*\}", " ", movetext)
+    previous = None
+    while previous != movetext:
+        previous = movetext
+        movetext = re.sub(r"\([^()]*\)", " ", movetext)
+    movetext = re.sub(r"\$\d+", " ", movetext)
+    movetext = re.sub(r"\d+\.(\.\.)?", " ", movetext)
+    return [token for token in movetext.split() if token not in RESULTS]
+
+
+def read_pgn(lines):
+    """
+    :param lines: iterable of str
+    :return: generator of Game
+    """
+    number = 0
+    tags = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            if movetext:
+                number += 1
+                yield Game(number, tags, clean_movetext(" ".join(movetext)), "san")
+                tags = {}
+                movetext = []
+            match = re.match(r'\[(\w+)\s+"(.*)"\]', line)
+            if match:
+                tags[match.group(1)] = match.group(2)
+        elif line and not line.startswith("%"):
+            # Comments starting with ; run to the end of the line
+            movetext.append(line.split(";", 1)[0])
+    if movetext or tags:
+        yield Game(number + 1, tags, clean_movetext(" ".join(movetext)), "san")
+
+
+def read_uci(lines):
+    """
+    One game per line of coordinate moves, optionally after "startpos moves" or "fen <fen> moves"
+    :param lines: iterable of str
+    :return: generator of Game
+    """
+    number = 0
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        tags = {}
+        if "moves" in tokens:
+            prefix = tokens[:tokens.index("moves")]
+            tokens = tokens[tokens.index("moves") + 1:]
+            if "fen" in prefix:
+                tags["FEN"] = " ".join(prefix[prefix.index("fen") + 1:])
+        number += 1
+        yield Game(number, tags, tokens, "uci")
+
+
+def read_games(lines, notation=None):
+    """
+    :param lines: iterable of str
+    :param notation: "pgn" or "uci", guessed from the first non-empty line if None
+    :return: generator of Game
+    """
+    lines = iter(lines)
+    if notation is None:
+        first = ""
+        for first in lines:
+            if first.strip():
+                break
+        lines = itertools.chain([first], lines)
+        stripped = first.strip()
+        notation = "pgn" if stripped.startswith("[") or re.match(r"\d+\.", stripped) else "uci"
+    return read_pgn(lines) if notation == "pgn" else read_uci(lines)
+
+
+def find_san_move(game_state, san):
+    """
+    The valid move written san in the position
+    :param game_state: GameState
+    :param san: str
+    :return: int, packed move
+    """
+    if san.startswith(("O-O", "0-0")):
+        raise UnsupportedMove("castling {}".format(san))
+    match = SAN_PATTERN.match(san)
+    if not match:
+        raise ReplayError("unreadable move {}".format(san))
+    piece, from_file, from_rank, destination, promotion = match.groups()
+    if promotion:
+        raise UnsupportedMove("promotion {}".format(san))
+
+    end = square_index(destination)
+    piece_type = PIECE_LETTERS[piece or "P"]
+    column = None if from_file is None else Move.files_to_columns[from_file]
+    row = None if from_rank is None else Move.ranks_to_rows[from_rank]
+    # Captures are always written with x, but some archives leave it out
+    kind = CAPTURES if "x" in san else ALL_MOVES
+    candidates = [
+        move for move in game_state.get_valid_move_codes(kind, 1 << end)
+        if (move >> MOVE_PIECE_SHIFT) & 7 == piece_type and
+        (column is None or move & 7 == column) and (row is None or (move & 63) >> 3 == row)
+    ]
+    if len(candidates) == 1:
+        return candidates[0]
+    if not candidates and piece_type == PAWN and column is not None and not game_state.squares[end]:
+        raise UnsupportedMove("en passant {}".format(san))
+    raise ReplayError("{} move {}".format("ambiguous" if candidates else "illegal", san))
+
+
+def find_uci_move(game_state, uci):
+    """
+    The valid move written uci in the position
+    :param game_state: GameState
+    :param uci: str, e.g. "e2e4"
+    :return: int, packed move
+    """
+    match = UCI_PATTERN.match(uci)
+    if not match:
+        raise ReplayError("unreadable move {}".format(uci))
+    if match.group(3):
+        raise UnsupportedMove("promotion {}".format(uci))
+    start = square_index(match.group(1))
+    end = square_index(match.group(2))
+    kind = CAPTURES if game_state.squares[end] else QUIETS
+    for move in game_state.get_valid_move_codes(kind, 1 << end):
+        if move & 63 == start:
+            return move
+
+    piece_type = game_state.squares[start] & 7
+    if piece_type == KING and abs((start & 7) - (end & 7)) == 2:
+        raise UnsupportedMove("castling {}".format(uci))
+    if piece_type == PAWN and start & 7 != end & 7 and not game_state.squares[end]:
+        raise UnsupportedMove("en passant {}".format(uci))
+    raise ReplayError("illegal move {}".format(uci))
+
+
+def start_game(game, game_state=None):
+    """
+    Position a game starts from, its FEN tag or the starting position
+    :param game: Game
+    :param game_state: GameState reused for the game, a new one if omitted
+    :return: GameState, raises ReplayError on a FEN tag it cannot read
+    """
+    if "FEN" in game.tags:
+        try:
+            return GameState.from_fen(game.tags["FEN"])
+        except ValueError as error:
+            raise ReplayError("game {}: {}".format(game.number, error))
+    if game_state is None:
+        return GameState()
+    game_state.restore(START)
+    return game_state
+
+
+def find_game_move(game, game_state, text):
+    """
+    The valid move written text in the current position of a game, in the notation of the game
+    :param game: Game
+    :param game_state: GameState
+    :param text: str
+    :return: int, packed move, raises ReplayError naming the game and the ply
+    """
+    find_move = find_san_move if game.notation == "san" else find_uci_move
+    try:
+        return find_move(game_state, text)
+    except ReplayError as error:
+        raise type(error)("game {} ply {}: {}".format(game.number, len(game_state.move_log) + 1, error))
+
+
+def replay_game(game, game_state=None):
+    """
+    Play a game, yielding the position after each move
+    The same GameState is yielded every time and changes with the next move, copy what must be kept
+    (to_fen or snapshot)
+    :param game: Game
+    :param game_state: GameState reused for the game, a new one if omitted
+    :return: generator of GameState, raises ReplayError on a move it cannot play
+    """
+    game_state = start_game(game, game_state)
+    for text in game.moves:
+        game_state.make_move(find_game_move(game, game_state, text))
+        yield game_state
+
+
+def replay_archive(lines, notation=None, stats=None, errors=None):
+    """
+    Replay every game of an archive, yielding each position
+    A game that cannot be replayed is counted in stats and its remaining moves are skipped
+    :param lines: iterable of str
+    :param notation: "pgn", "uci" or None to guess
+    :param stats: ReplayStats updated as the games go
+    :param errors: function called with each ReplayError
+    :return: generator of tuples (Game, GameState)
+    """
+    if stats is None:
+        stats = ReplayStats()
+    game_state = GameState()
+    for game in read_games(lines, notation):
+        try:
+            for position in replay_game(game, game_state):
+                stats.moves += 1
+                yield game, position
+        except UnsupportedMove as error:
+            stats.unsupported += 1
+            if errors is not None:
+                errors(error)
+        except ReplayError as error:
+            stats.failed += 1
+            if errors is not None:
+                errors(error)
+        stats.games += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay PGN or UCI games through the move generator")
+    parser.add_argument("file", nargs="?", default="-", help="archive to read, stdin if omitted or -")
+    parser.add_argument("--format", choices=("pgn", "uci"), help="guessed from the first line if omitted")
+    parser.add_argument("--output", choices=("none", "fen"), default="none", help="print every position")
+    parser.add_argument("--errors", action="store_true", help="print the games that could not be replayed")
+    args = parser.parse_args()
+
+    stream = sys.stdin if args.file == "-" else open(args.file)
+    stats = ReplayStats()
+    errors = (lambda error: print(error, file=sys.stderr)) if args.errors else None
+    try:
+        for game, game_state in replay_archive(stream, args.format, stats, errors):
+            if args.output == "fen":
+                sys.stdout.write(game_state.to_fen() + "\n")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(stats, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
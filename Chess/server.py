@@ -0,0 +1,284 @@
+"""
+Game server: many games held by one process and played over a local TCP port or a Unix socket
+Requests and answers are JSON objects, one per line. Every answer has "ok", and "error" when it is
+false; the "id" of a request, if any, is sent back with its answer
+
+{"id": 1, "op": "new", "fen": "<optional FEN>"}  -> "game", "fen", "status"
+{"id": 2, "op": "moves", "game": 1}              -> "moves" in UCI notation, "status"
+{"id": 3, "op": "move", "game": 1, "move": "e2e4"} -> "fen", "status"
+{"id": 4, "op": "undo", "game": 1}               -> "fen", "status"
+{"id": 5, "op": "state", "game": 1}              -> "fen", "history", "status"
+{"id": 6, "op": "close", "game": 1}
+{"id": 7, "op": "stats"}                         -> "games", "requests", "errors", "cache"
+
+status is "playing", "check", "checkmate" or "stalemate"
+Requests take microseconds and are answered on the event loop itself. A game idle between two
+requests is compacted, see GameState.compact, and the valid moves are cached by position for all
+the games, so common openings are generated once
+
+python -m Chess.server --port 8765
+python -m Chess.server --unix /tmp/chess.sock
+"""
+
+import argparse
+import asyncio
+import json
+from array import array
+
+from Chess.ChessEngine import GameState, Move
+from Chess.LRUCache import LRUCache
+from Chess.replay import find_uci_move
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_GAMES = 100000
+# Positions whose valid moves are kept, shared by every game
+DEFAULT_CACHE_ENTRIES = 1 << 14
+
+
+class GameServer:
+    """
+    Games of every client, by id, and the requests that play them
+    Games outlive the connection that created them, any client knowing an id can play it
+    """
+    def __init__(self, max_games=DEFAULT_MAX_GAMES, cache_entries=DEFAULT_CACHE_ENTRIES):
+        """
+        :param max_games: int, new fails beyond it
+        :param cache_entries: int, positions whose valid moves are kept
+        """
+        self.max_games = max_games
+        self.games = {}
+        self.next_game = 1
+        # zobrist key -> tuple (packed moves, UCI moves joined by spaces, status), one string takes
+        # a fraction of the memory of a string per move
+        self.move_cache = LRUCache(cache_entries)
+        self.requests = 0
+        self.errors = 0
+        self.operations = {
+            "new": self.new_game,
+            "moves": self.get_moves,
+            "move": self.make_move,
+            "undo": self.undo_move,
+            "state": self.get_state,
+            "close": self.close_game,
+            "stats": self.get_stats,
+        }
+
+    def answer(self, line):
+        """
+        Run one request line
+        :param line: bytes or str, a JSON object
+        :return: bytes, the JSON answer and its newline
+        """
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request is not an object")
+            request_id = request.get("id")
+            op = request.get("op")
+            operation = self.operations.get(op) if isinstance(op, str) else None
+            if operation is None:
+                raise ValueError("unknown op {}".format(op))
+            answer = operation(request)
+            answer["ok"] = True
+        except ValueError as error:
+            # ReplayError and JSON errors are ValueErrors
+            self.errors += 1
+            answer = {"ok": False, "error": str(error)}
+        if request_id is not None:
+            answer["id"] = request_id
+        return (json.dumps(answer, separators=(",", ":")) + "\n").encode()
+
+    def find_game(self, request):
+        """
+        :param request: dict with the id of a game
+        :return: GameState
+        """
+        game = request.get("game")
+        # Not isinstance, true would read game 1
+        game_state = self.games.get(game) if type(game) is int else None
+        if game_state is None:
+            raise ValueError("unknown game {}".format(request.get("game")))
+        return game_state
+
+    def legal_moves(self, game_state):
+        """
+        Valid moves of the position of a game, from the cache if another game was there before
+        :param game_state: GameState
+        :return: tuple (array of packed moves, str of the UCI moves separated by spaces, status)
+        """
+        key = game_state.zobrist_key
+        entry = self.move_cache.get(key)
+        if entry is None:
+            codes = array('I', game_state.get_valid_move_codes())
+            if codes:
+                status = "check" if game_state.in_check else "playing"
+            else:
+                status = "checkmate" if game_state.in_check else "stalemate"
+            entry = (codes, " ".join(Move(code).get_chess_notation() for code in codes), status)
+            self.move_cache.put(key, entry)
+            # The buffer the moves were generated in is not needed until the next move
+            game_state.compact()
+        return entry
+
+    def describe(self, game_state, answer):
+        """
+        :param game_state: GameState
+        :param answer: dict, fen and status are added to it
+        :return: answer
+        """
+        answer["fen"] = game_state.to_fen()
+        answer["status"] = self.legal_moves(game_state)[2]
+        return answer
+
+    def new_game(self, request):
+        """
+        :param request: dict, optional fen, the starting position if omitted
+        :return: dict
+        """
+        if len(self.games) >= self.max_games:
+            raise ValueError("too many games, {} are open".format(len(self.games)))
+        fen = request.get("fen")
+        if fen is None:
+            game_state = GameState()
+        elif isinstance(fen, str):
+            game_state = GameState.from_fen(fen)
+        else:
+            raise ValueError("fen is not a string")
+        game_state.compact()
+        game = self.next_game
+        self.next_game += 1
+        self.games[game] = game_state
+        return self.describe(game_state, {"game": game})
+
+    def get_moves(self, request):
+        """
+        :param request: dict, game
+        :return: dict
+        """
+        _, moves, status = self.legal_moves(self.find_game(request))
+        return {"moves": moves.split(), "status": status}
+
+    def make_move(self, request):
+        """
+        :param request: dict, game and move in UCI notation
+        :return: dict
+        """
+        game_state = self.find_game(request)
+        text = request.get("move")
+        if not isinstance(text, str):
+            raise ValueError("move is missing")
+        codes, moves, _ = self.legal_moves(game_state)
+        moves = moves.split()
+        if text in moves:
+            move = codes[moves.index(text)]
+        else:
+            # Tells castling and en passant from illegal moves
+            move = find_uci_move(game_state, text)
+        game_state.make_move(move)
+        game_state.compact()
+        return self.describe(game_state, {})
+
+    def undo_move(self, request):
+        """
+        :param request: dict, game
+        :return: dict
+        """
+        game_state = self.find_game(request)
+        if not game_state.move_log:
+            raise ValueError("no move to undo")
+        game_state.rollback_move()
+        return self.describe(game_state, {})
+
+    def get_state(self, request):
+        """
+        :param request: dict, game
+        :return: dict, with the moves played in UCI notation
+        """
+        game_state = self.find_game(request)
+        history = [Move(move).get_chess_notation() for move in game_state.move_log]
+        return self.describe(game_state, {"history": history, "white_turn": game_state.white_turn})
+
+    def close_game(self, request):
+        """
+        :param request: dict, game
+        :return: dict
+        """
+        self.find_game(request)
+        del self.games[request["game"]]
+        return {}
+
+    def get_stats(self, request):
+        """
+        :param request: dict
+        :return: dict
+        """
+        return {"games": len(self.games), "requests": self.requests, "errors": self.errors,
+                "cache": self.move_cache.stats()}
+
+    async def serve_client(self, reader, writer):
+        """
+        Answer the requests of one connection until it closes
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter
+        :return: void
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self.answer(line))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than the stream limit, the client is not speaking the protocol
+            pass
+        finally:
+            writer.close()
+
+
+async def start(game_server, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+    """
+    :param game_server: GameServer
+    :param host: str
+    :param port: int, 0 for any free port
+    :param unix: str, Unix socket path listened on instead of host and port
+    :return: asyncio.Server, listening
+    """
+    if unix is not None:
+        return await asyncio.start_unix_server(game_server.serve_client, path=unix)
+    return await asyncio.start_server(game_server.serve_client, host, port)
+
+
+async def serve(game_server, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+    """
+    Listen until the process is interrupted
+    :return: void
+    """
+    listener = await start(game_server, host, port, unix)
+    for socket in listener.sockets:
+        print("listening on {}".format(socket.getsockname()), flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-game server, JSON lines over TCP or a Unix socket")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-games", type=int, default=DEFAULT_MAX_GAMES)
+    parser.add_argument("--cache-entries", type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help="positions whose valid moves are kept")
+    args = parser.parse_args()
+    game_server = GameServer(args.max_games, args.cache_entries)
+    try:
+        asyncio.run(serve(game_server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
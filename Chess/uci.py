@@ -0,0 +1,280 @@
+"""
+UCI front-end: speaks the Universal Chess Interface over stdin/stdout so the engine runs under
+tournament managers and scripts, without a window
+The search runs on its own thread, so isready, stop and quit are answered while it thinks
+
+python -m Chess.uci
+"""
+
+import random
+import sys
+import threading
+
+from Chess import Search
+from Chess.ChessEngine import GameState
+from Chess.Evaluation import Evaluator
+from Chess.OpeningBook import OpeningBook
+from Chess.replay import ReplayError, find_uci_move
+from Chess.TranspositionTable import DEFAULT_SIZE_MB, TranspositionTable
+
+ENGINE_NAME = "Simple chess engine"
+# Moves assumed left in the game when the GUI does not send movestogo
+DEFAULT_MOVES_TO_GO = 30
+# Seconds kept aside for the GUI and the pipe on every move
+MOVE_OVERHEAD = 0.05
+
+
+def format_score(score):
+    """
+    :param score: int, centipawns or mate score from the side to move point of view
+    :return: str, "cp <n>" or "mate <moves>"
+    """
+    if abs(score) >= Search.MATE_SCORE - Search.MAX_DEPTH:
+        plies = Search.MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate {}".format(moves if score > 0 else -moves)
+    return "cp {}".format(score)
+
+
+def parse_limits(tokens, white_turn):
+    """
+    SearchLimits of a go command
+    :param tokens: list of str, the arguments of go
+    :param white_turn: boolean, side the clock is read for
+    :return: tuple (SearchLimits, infinite)
+    """
+    values = {}
+    infinite = False
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ("infinite", "ponder"):
+            infinite = True
+            i += 1
+        elif i + 1 < len(tokens):
+            try:
+                values[tokens[i]] = int(tokens[i + 1])
+            except ValueError:
+                pass
+            i += 2
+        else:
+            i += 1
+
+    limits = Search.SearchLimits(depth=values.get("depth"), nodes=values.get("nodes"))
+    if "movetime" in values:
+        limits.time = max(0.001, values["movetime"] / 1000 - MOVE_OVERHEAD)
+    elif not infinite:
+        remaining = values.get("wtime" if white_turn else "btime")
+        if remaining is not None:
+            increment = values.get("winc" if white_turn else "binc", 0) / 1000
+            remaining /= 1000
+            budget = remaining / values.get("movestogo", DEFAULT_MOVES_TO_GO) + increment * 0.8
+            limits.time = max(0.01, min(budget, remaining / 2 - MOVE_OVERHEAD))
+    return limits, infinite
+
+
+class UciEngine:
+    """
+    State of a UCI session: the position, the transposition table and the running search
+    """
+    def __init__(self, output=sys.stdout):
+        """
+        :param output: file the engine writes its answers to
+        """
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.game_state = GameState()
+        # Why the last position command could not be set up, go does not search then
+        self.position_error = None
+        self.table_mb = DEFAULT_SIZE_MB
+        self.table = None
+        # Evaluations only depend on the position, the caches are kept for the whole session
+        self.evaluator = Evaluator()
+        # Book moves are drawn in proportion to their weight
+        self.book = None
+        self.book_random = random.Random()
+        self.searcher = None
+        self.search_thread = None
+        # Set by stop when an infinite search must keep its bestmove until then
+        self.stop_event = threading.Event()
+
+    def send(self, line):
+        """
+        Write a line to the GUI, safe to call from the search thread
+        :param line: str
+        :return: void
+        """
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """
+        Run one command
+        :param line: str
+        :return: boolean, False once quit is received
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name {}".format(ENGINE_NAME))
+            self.send("option name Hash type spin default {} min 1 max 4096".format(DEFAULT_SIZE_MB))
+            self.send("option name BookFile type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.table = None
+        elif command == "position":
+            self.stop_search()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop_search()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            self.stop_search()
+            if self.book is not None:
+                self.book.close()
+            return False
+        return True
+
+    def set_option(self, arguments):
+        """
+        setoption name <name> value <value>, Hash and BookFile are known
+        :param arguments: list of str
+        :return: void
+        """
+        if "name" in arguments and "value" in arguments:
+            name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")])
+            value = " ".join(arguments[arguments.index("value") + 1:])
+            if name.lower() == "hash" and value.isdigit():
+                self.stop_search()
+                self.table_mb = int(value)
+                self.table = None
+            elif name.lower() == "bookfile":
+                self.stop_search()
+                if self.book is not None:
+                    self.book.close()
+                    self.book = None
+                if value and value != "<empty>":
+                    try:
+                        self.book = OpeningBook(value)
+                    except (OSError, ValueError) as error:
+                        self.send("info string {}".format(error))
+
+    def set_position(self, arguments):
+        """
+        position startpos|fen <fen> [moves <move> ...]
+        :param arguments: list of str
+        :return: void
+        """
+        moves = []
+        if "moves" in arguments:
+            moves = arguments[arguments.index("moves") + 1:]
+            arguments = arguments[:arguments.index("moves")]
+        if arguments and arguments[0] == "fen":
+            try:
+                game_state = GameState.from_fen(" ".join(arguments[1:]))
+            except ValueError as error:
+                # Searching the previous position would answer for a position the GUI did not send
+                self.send("info string {}".format(error))
+                self.position_error = str(error)
+                return
+        else:
+            game_state = GameState()
+        self.position_error = None
+        for text in moves:
+            try:
+                game_state.make_move(find_uci_move(game_state, text))
+            except ReplayError as error:
+                self.send("info string {}".format(error))
+                self.position_error = str(error)
+                break
+        self.game_state = game_state
+
+    def go(self, arguments):
+        """
+        Start searching the current position on the search thread
+        :param arguments: list of str
+        :return: void
+        """
+        if self.position_error is not None:
+            # Searching the position before the unplayable move would answer for the wrong side
+            self.send("info string no valid position, {}".format(self.position_error))
+            self.send("bestmove 0000")
+            return
+        limits, infinite = parse_limits(arguments, self.game_state.white_turn)
+        if self.book is not None and not infinite:
+            move = self.book.choose_move(self.game_state, self.book_random)
+            if move is not None:
+                self.send("info string book move")
+                self.send("bestmove {}".format(move.get_chess_notation()))
+                return
+        if self.table is None:
+            self.table = TranspositionTable(self.table_mb)
+        self.stop_event.clear()
+        self.searcher = Search.Searcher(self.game_state, limits, self.table, evaluator=self.evaluator)
+        self.search_thread = threading.Thread(target=self.run_search, args=(self.searcher, infinite), daemon=True)
+        self.search_thread.start()
+
+    def run_search(self, searcher, infinite):
+        """
+        Body of the search thread
+        :param searcher: Searcher
+        :param infinite: boolean, hold bestmove until stop
+        :return: void
+        """
+        result = searcher.search(self.send_info, self.send_progress)
+        if infinite:
+            self.stop_event.wait()
+        self.send("bestmove {}".format(result.move.get_chess_notation() if result.move is not None else "0000"))
+
+    def send_info(self, result):
+        """
+        info line of a completed iteration
+        :param result: SearchResult
+        :return: void
+        """
+        self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(
+            result.depth, format_score(result.score), result.nodes, result.nps, int(result.seconds * 1000),
+            " ".join(move.get_chess_notation() for move in result.pv)))
+
+    def send_progress(self, nodes, seconds):
+        """
+        info line sent while an iteration is running
+        :param nodes: int
+        :param seconds: float
+        :return: void
+        """
+        self.send("info nodes {} nps {} time {}".format(nodes, int(nodes / seconds) if seconds > 0 else 0,
+                                                        int(seconds * 1000)))
+
+    def stop_search(self):
+        """
+        Stop the running search, if any, and wait for its bestmove
+        :return: void
+        """
+        if self.search_thread is not None:
+            self.searcher.stop()
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+            self.searcher = None
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop_search()
+
+
+if __name__ == '__main__':
+    main()